@@ -7,23 +7,25 @@ from dash.dependencies import ClientsideFunction
 import pandas as pd
 import io
 import base64
-import os
-import tempfile
+import logging
 
-from functools import lru_cache
+from datetime import datetime
+from flask import request, Response, abort, stream_with_context
 
 from page_layout import display_page, get_menu_layout, set_active_links, generate_result_charts
-from external_functions import load_data, save_data, load_data_table, get_network_elements_from_df, create_network, run_optimization
-from results_charts import generate_dashboard_chart
-
-from external_functions import log_stream, interval_disabled  # Import global variables
+from external_functions import load_data, save_data, reset_read_stats, get_read_stats, get_network_elements_from_df, get_network, get_aggregated_network, scale_plant_capacities, scale_network_elements, import_network_workbook, stream_network_archive, EXPORT_FORMATS
+from results_charts import generate_dashboard_chart, generate_run_profile
+from time_aggregation import REPRESENTATIVE_DAYS, CLUSTER_METHOD, RESOLUTION_HOURS
+from network_reduction import NETWORK_ZONES, reduce_network
+from results_store import save_results
+from instrumentation import record_stages, track_stage, write_run_record
+from optimization_jobs import submit_optimization, get_job_status, read_job_log, get_job_progress, forget_job
 
 
 # Set up the SQLite database connection function
 DATABASE_PATH = 'power_system.db'
 
-# Load data into Pandas DataFrame from SQLite
-power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df = load_data(DATABASE_PATH)
+logger = logging.getLogger(__name__)
 
 # Initialize Dash app with Bootstrap stylesheet
 app = dash.Dash(
@@ -39,6 +41,25 @@ app.title = 'Clean Power Sim'
 app._favicon = ("assets/favicon.ico")
 
 
+# Report the rows and bytes each request reads from the database
+@app.server.before_request
+def start_read_stats():
+    reset_read_stats()
+
+@app.server.after_request
+def report_read_stats(response):
+    stats = get_read_stats()
+    if stats:
+        # Name Dash callback requests after the outputs they update
+        payload = request.get_json(silent=True) if request.is_json else None
+        label = payload.get('output', request.path) if isinstance(payload, dict) else request.path
+        rows = sum(table_rows for table_rows, _ in stats.values())
+        n_bytes = sum(table_bytes for _, table_bytes in stats.values())
+        tables = ", ".join(f"{table} {table_rows}" for table, (table_rows, _) in stats.items())
+        logger.debug("Read %d rows (%.2f MB) for %s: %s", rows, n_bytes / 1e6, label, tables)
+    return response
+
+
 # Define layout with an enhanced sidebar for navigation
 app.layout = dbc.Container([
     dbc.Row([
@@ -69,7 +90,8 @@ app.layout = dbc.Container([
     dcc.Store(id='optimization-intent', data=False, storage_type='memory'),  # Track user intent to run optimization
     dcc.Interval(id="optimization-interval", interval=1000, n_intervals=0, disabled=True),  # Interval for updates
     dcc.Store(id='optimization-progress-store', data=0, storage_type='memory'),  # Store for progress updates
-    dcc.Store(id='optimization-results', data=None, storage_type='memory'),  # Store to keep optimization results
+    dcc.Store(id='optimization-results', data=None, storage_type='memory'),  # Id of the latest optimization results, stored on the server
+    dcc.Store(id='optimization-job', data=None, storage_type='memory'),  # Id of the running optimization job
     dcc.Store(id={'type': 'save-status', 'index': 'global'}, data=0, storage_type='memory')
 ], fluid=True)
 
@@ -147,15 +169,13 @@ def navigate_to_results_and_set_intent(n_clicks, optimization_modal):
         return '/results', True, True
     raise PreventUpdate  # Prevent unnecessary updates if not clicked
 
-# Callback to run optimization when the intent is set
+# Callback to submit the optimization as a background job when the intent is set
 @app.callback(
     [
-        Output('optimization-intent', 'data', allow_duplicate=True),  # Reset the intent after running
-        Output('optimization-results', 'data', allow_duplicate=True),  # Store the results
-        Output('optimization-interval', 'disabled', allow_duplicate=True), # Set the interval for async running of optimization
-        Output({'type': 'run-output', 'index': 'results'}, 'children', allow_duplicate=True), # Output to display the result of the optimization
-        Output({'type': 'dynamic-graphs-container', 'index': 'results'}, 'children', allow_duplicate=True), # Output to display the charts of the optimization result
-        Output("optimization-modal", "is_open", allow_duplicate=True), # Close the modal after optimization
+        Output('optimization-job', 'data'),  # Id of the submitted job, polled by update_logs_and_fetch_results
+        Output('optimization-interval', 'disabled', allow_duplicate=True), # Start polling the job
+        Output('solver-output', 'children', allow_duplicate=True), # Clear the output of any previous run
+        Output({'type': 'run-output', 'index': 'results'}, 'children', allow_duplicate=True), # Output to display the status of the optimization
     ],
     [
         Input('optimization-intent', 'data')
@@ -163,75 +183,105 @@ def navigate_to_results_and_set_intent(n_clicks, optimization_modal):
     prevent_initial_call=True
 )
 def run_optimization_callback(optimization_intent):
-    global interval_disabled
-
     if optimization_intent:     
         print("Running optimization...")
-        # Load network data and create network object HERE, in the main thread
-        power_plants_df, storage_units_df, buses_df, lines_df, demand_df, snapshots_df, wind_profile_df, solar_profile_df  = load_data(DATABASE_PATH)
-        network = create_network(power_plants_df, storage_units_df, buses_df, lines_df, demand_df, snapshots_df, wind_profile_df, solar_profile_df)
+        # Get a copy of the cached network (built here, in the main thread, if the database has changed), or a
+        # network over representative days and/or a coarser time resolution when the run is set up to use them
+        # Loading the data and building the network are timed as the run's first stages (see instrumentation)
+        with record_stages() as preparation_stages:
+            if REPRESENTATIVE_DAYS or RESOLUTION_HOURS > 1:
+                network = get_aggregated_network(DATABASE_PATH, REPRESENTATIVE_DAYS, CLUSTER_METHOD, RESOLUTION_HOURS)
+            else:
+                network = get_network(DATABASE_PATH, copy=True)
 
-        # Run optimization directly (no threading)
-        optimization_results = run_optimization(network)  # Get the results directly
+            # Optionally solve a smaller network with the buses clustered into zones
+            if NETWORK_ZONES:
+                with track_stage('reduce_network'):
+                    network = reduce_network(network, NETWORK_ZONES)
 
-        if optimization_results is not None:  # Check result from optimization
-            print("Optimization complete! storing results.") # Check to see if it completes
-            interval_disabled = True # disable interval as soon as result or exception occurs.
+        # Hand the run to a worker process and return straight away; the interval callback collects the results
+        job_id = submit_optimization(network, preparation_stages)
 
-            charts_html = generate_result_charts(optimization_results)
-            run_output = "Optimization complete!"
-
-            return False, optimization_results, interval_disabled, run_output, charts_html, False  # Return the actual result
-        else:
-            print("Optimization Failed.  Returning None")
-            interval_disabled = True # disable interval as soon as result or exception occurs.
-
-            charts_html = "Charts will appear here once the model has finished optimization"
-            run_output = "Optimization model has failed."
-
-            return False, None, interval_disabled, run_output, charts_html, True  # Return None which indicates error to callback
+        return job_id, False, "", f"Optimization job {job_id[:8]} submitted..."
 
     else:
-        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update
 
 
-# Callback to Update Logs and Fetch Results
+# Callback to poll the optimization job, update logs and fetch results
 @app.callback(
     [
         Output('optimization-progress', 'value'),
+        Output('optimization-progress', 'label'),
         Output('solver-output', 'children'),
         Output('optimization-results', 'data', allow_duplicate=True),
         Output('optimization-interval', 'disabled', allow_duplicate=True),
+        Output('optimization-intent', 'data', allow_duplicate=True),  # Reset the intent once the job has finished
+        Output({'type': 'run-output', 'index': 'results'}, 'children', allow_duplicate=True), # Output to display the result of the optimization
+        Output({'type': 'dynamic-graphs-container', 'index': 'results'}, 'children', allow_duplicate=True), # Output to display the charts of the optimization result
+        Output("optimization-modal", "is_open", allow_duplicate=True), # Close the modal after optimization
     ],
     Input("optimization-interval", "n_intervals"),
     [State("solver-output", "children"),
-     State("optimization-results", "data")],
-     State('optimization-interval','disabled'),
+     State("optimization-job", "data")],
     prevent_initial_call=True,
 )
-def update_logs_and_fetch_results(n_intervals, current_output, current_results, interval_disabled_state):
-    global log_stream
-    global interval_disabled
-
-    if interval_disabled: # Prevent updates and further checks if already disabled
+def update_logs_and_fetch_results(n_intervals, current_output, job_id):
+    if not job_id:
         raise PreventUpdate
 
-    # Initialize progress
-    progress = min(n_intervals*0.1, 100)  # Simulate progress
-
-    # Fetch new logs from the log stream
-    log_stream.seek(0)
-    new_logs = log_stream.read()
-    log_stream.truncate(0)
-    log_stream.seek(0)
+    job = get_job_status(job_id)
 
-    # Append new logs to the current output
+    # Append the job's new log and solver output to the current output
+    new_logs = read_job_log(job_id)
     updated_output = current_output or ""
-    updated_output += "\n" + new_logs
+    if new_logs:
+        updated_output += new_logs
+
+    if job['status'] in ('queued', 'running'):
+        progress, summary = get_job_progress(job_id)
+        run_output = f"Optimization job {job_id[:8]} {job['status']} ({job['elapsed']:.0f}s)... {summary}"
+        return progress, summary, updated_output, dash.no_update, False, dash.no_update, run_output, dash.no_update, dash.no_update
+
+    forget_job(job_id)
+
+    if job['status'] == 'done':
+        print("Optimization complete! storing results.") # Check to see if it completes
+
+        # The run's stages: building the network here, then the worker's model build, solve and result
+        # extraction, then the charts
+        instrumentation = job['result'].setdefault('instrumentation', {})
+        with record_stages() as chart_stages:
+            with track_stage('generate_result_charts'):
+                charts_html = generate_result_charts(job['result'])
+        instrumentation['stages'] = job['preparation_stages'] + instrumentation.get('stages', []) + chart_stages
+        solver = job['result'].get('solver') or {}
+        run_output = f"Optimization complete! ({job['elapsed']:.0f}s, solved with {solver.get('name', 'unknown solver')} in {solver.get('solve_time', 0):.1f}s)"
+        if job['result'].get('cached'):
+            run_output = f"Optimization complete! ({job['elapsed']:.0f}s, results of an identical earlier run, solved with {solver.get('name', 'unknown solver')})"
+        windows = job['result'].get('windows') or []
+        peak_memory = [window['peak_memory_mb'] for window in windows if window['peak_memory_mb'] is not None]
+        if len(windows) > 1:
+            run_output += f" - {len(windows)} rolling-horizon windows"
+        if peak_memory:
+            run_output += f", peak memory {max(peak_memory):.0f} MB"
+
+        # The results stay on the server; the browser only keeps their id (see results_store)
+        result_id = save_results(job['result'])
+
+        # A machine-readable record of the run, to follow performance across releases
+        write_run_record({'timestamp': datetime.now().isoformat(timespec='seconds'), 'result_id': result_id,
+                          'solver': solver.get('name'), 'cached': bool(job['result'].get('cached')), **instrumentation})
+        charts_html = html.Div([charts_html, generate_run_profile(instrumentation)])
+
+        return 100, "Complete", updated_output, {'result_id': result_id}, True, False, run_output, charts_html, False
+    else:
+        print(f"Optimization Failed: {job['error']}")
 
-    progress = 100
+        charts_html = "Charts will appear here once the model has finished optimization"
+        run_output = "Optimization model has failed."
 
-    return progress, updated_output, current_results, interval_disabled
+        return 100, "Failed", updated_output + "\n" + str(job['error']), None, True, False, run_output, charts_html, True  # Keep the modal open to show the error
 
 
 
@@ -274,6 +324,19 @@ def download_network_data(n_clicks):
     return dcc.send_bytes(output.getvalue(), "network_data.xlsx")
 
 
+# Route streaming the network data as a zip of one CSV or Parquet file per table (for models too large for Excel)
+@app.server.route('/download/network_data_<export_format>.zip')
+def download_network_archive(export_format):
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+
+    return Response(
+        stream_with_context(stream_network_archive(DATABASE_PATH, export_format)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=network_data_{export_format}.zip'}
+    )
+
+
 # Callback to handle uploading replacement network file
 @app.callback(
     Output({'type': 'save-status', 'index': MATCH}, 'data', allow_duplicate=True),
@@ -288,40 +351,15 @@ def upload_network_data(n_clicks, contents, filename):
 
     content_type, content_string = contents.split(',')
     decoded = base64.b64decode(content_string)
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as temp_file:
-        temp_file.write(decoded)
-        temp_file_path = temp_file.name
 
-    # Load the uploaded Excel file into Pandas DataFrames
+    # Parse the uploaded Excel file in memory and save all of its tables to the SQLite database in one transaction
     try:
-        with pd.ExcelFile(temp_file_path) as xls:
-            power_plants_df = pd.read_excel(xls, 'Power Plants')
-            buses_df = pd.read_excel(xls, 'Buses')
-            lines_df = pd.read_excel(xls, 'Transmission Lines')
-            demand_df = pd.read_excel(xls, 'Demand Profile', parse_dates=['snapshot'])
-            storage_units_df = pd.read_excel(xls, 'Storage Units')
-            snapshots_df = pd.read_excel(xls, 'Snapshots', parse_dates=['snapshot_time'])
-            wind_profile_df = pd.read_excel(xls, 'Wind Profile')
-            solar_profile_df = pd.read_excel(xls, 'Solar Profile')
-
-            # Save to the SQLite database
-            save_data(DATABASE_PATH, 'power_plants', power_plants_df)
-            save_data(DATABASE_PATH, 'buses', buses_df)
-            save_data(DATABASE_PATH, 'lines', lines_df)
-            save_data(DATABASE_PATH, 'demand_profile', demand_df)
-            save_data(DATABASE_PATH, 'storage_units', storage_units_df)
-            save_data(DATABASE_PATH, 'snapshots', snapshots_df)
-            save_data(DATABASE_PATH, 'wind_profile', wind_profile_df)
-            save_data(DATABASE_PATH, 'solar_profile', solar_profile_df)
+        import_network_workbook(DATABASE_PATH, io.BytesIO(decoded))
 
     except Exception as e:
         print(f"Error loading uploaded network data: {e}")
         raise PreventUpdate
 
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file_path)
-
     return 1  # Signal that the save was successful
 
 
@@ -335,42 +373,32 @@ def upload_network_data(n_clicks, contents, filename):
         Input('wind-slider', 'value'),
         Input('dsr-slider', 'value')
     ],
+    [
+        State('network-data', 'data')
+    ],
     prevent_initial_call=True
 )
-def update_generator_capacities(new_solar_capacity, new_wind_capacity, new_dsr_capacity):
+def update_generator_capacities(new_solar_capacity, new_wind_capacity, new_dsr_capacity, network_data):
     # Check if the callback context has triggered the callback
     if not ctx.triggered:
         raise PreventUpdate
 
-    power_plants_df = load_data_table(DATABASE_PATH, 'power_plants')
-
-    # Calculate original capacities
-    solar_capacity = power_plants_df.loc[power_plants_df['type'] == 'Solar', 'capacity_mw'].sum()
-    wind_capacity = power_plants_df.loc[power_plants_df['type'] == 'Wind', 'capacity_mw'].sum()
-    dsr_capacity = power_plants_df.loc[power_plants_df['type'] == 'DSR', 'capacity_mw'].sum()
-
-    # TO ADD: code that handles the possibility that all solar/wind/DSR capacity has been set to zero
-
-    # Adjust solar capacities
-    solar_generators = power_plants_df[power_plants_df['type'] == 'Solar']
-    power_plants_df.loc[solar_generators.index, 'capacity_mw'] = \
-        solar_generators['capacity_mw'] * (new_solar_capacity * 1000 / solar_capacity)
-
-    # Adjust wind capacities
-    wind_generators = power_plants_df[power_plants_df['type'] == 'Wind']
-    power_plants_df.loc[wind_generators.index, 'capacity_mw'] = \
-        wind_generators['capacity_mw'] * (new_wind_capacity * 1000 / wind_capacity)
-
-    # Adjust dsr capacities
-    dsr_generators = power_plants_df[power_plants_df['type'] == 'DSR']
-    power_plants_df.loc[dsr_generators.index, 'capacity_mw'] = \
-        dsr_generators['capacity_mw'] * (new_dsr_capacity * 1000 / dsr_capacity)
-
-    # Save back to database
-    save_data(DATABASE_PATH, 'power_plants', power_plants_df)
+    # Scale the solar, wind and DSR plants to the new totals (sliders are in GW).  Only the changed rows are
+    # updated in the database and the cached network is patched in place.
+    factors = scale_plant_capacities(DATABASE_PATH, {
+        'Solar': new_solar_capacity * 1000,
+        'Wind': new_wind_capacity * 1000,
+        'DSR': new_dsr_capacity * 1000
+    })
 
+    if not factors:
+        raise PreventUpdate
 
-    network_data = get_network_elements_from_df(DATABASE_PATH)
+    # Patch the diagram data already in the browser rather than rebuilding it from the database
+    if network_data:
+        network_data = scale_network_elements(network_data, factors)
+    else:
+        network_data = get_network_elements_from_df(DATABASE_PATH)
 
     return [network_data]
 
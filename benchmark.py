@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+
+# Every size must really build and solve its model: don't return cached results or reuse a model between sizes
+os.environ['CLEANPOWERSIM_RESULT_CACHE_MB'] = '0'
+os.environ['CLEANPOWERSIM_REUSE_MODEL'] = '0'
+
+from external_functions import load_data, create_network, run_optimization, get_network_elements_from_df
+from instrumentation import record_stages, track_stage, summarize_stages, get_versions
+from model_checks import check_nodal_capacity_vs_demand
+from results_charts import generate_result_charts
+from setup_database import create_schema
+
+# Synthetic networks the pipeline is timed on, from a few seconds' work to about a minute's
+BENCHMARK_SIZES = [
+    {'buses': 10, 'plants_per_bus': 4, 'storage_units': 5, 'snapshots': 168},
+    {'buses': 30, 'plants_per_bus': 6, 'storage_units': 15, 'snapshots': 336},
+    {'buses': 100, 'plants_per_bus': 8, 'storage_units': 50, 'snapshots': 720}
+]
+
+# Timings are compared against this file (written with --save-baseline)
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# A stage has regressed when it takes more than BENCHMARK_TOLERANCE times its baseline wall time, and at least
+# BENCHMARK_MIN_SECONDS longer, so noise in the very short stages isn't reported
+BENCHMARK_TOLERANCE = float(os.environ.get('CLEANPOWERSIM_BENCHMARK_TOLERANCE', 1.5))
+BENCHMARK_MIN_SECONDS = float(os.environ.get('CLEANPOWERSIM_BENCHMARK_MIN_SECONDS', 0.5))
+
+# Plant types of the synthetic networks, cycled through at each bus, with their short-run marginal costs (£/MWh).
+# DSR is the expensive last resort that keeps every network feasible.
+PLANT_TYPES = [('Wind', 0), ('Solar', 0), ('CCGT', 60), ('Nuclear', 10), ('Biomass', 45), ('OCGT', 120), ('DSR', 300)]
+PROFILED_TYPES = ['Wind', 'Solar']
+
+BENCHMARK_START = np.datetime64('2030-01-01T00:00:00')
+
+
+def get_size_name(size):
+    return f"{size['buses']} buses x {size['plants_per_bus']} plants, {size['storage_units']} storage, {size['snapshots']} snapshots"
+
+def generate_network_database(path, buses, plants_per_bus, storage_units, snapshots, seed=0):
+    # Writes a random but reproducible network of the given size to a new SQLite database at 'path', with the
+    # schema of setup_database.py: 'buses' buses joined by a spanning tree of lines plus a few loops,
+    # 'plants_per_bus' plants at every bus, 'storage_units' batteries and hourly demand, wind and solar profiles
+    rng = np.random.default_rng(seed)
+    times = ((BENCHMARK_START + np.arange(snapshots) * np.timedelta64(1, 'h')) - np.datetime64('1970-01-01T00:00:00')) // np.timedelta64(1, 's')
+    times = times.astype(int).tolist()
+    hours = np.arange(snapshots) % 24
+
+    # Buses scattered over a few degrees of longitude and latitude
+    bus_ids = np.arange(1, buses + 1)
+    longitudes, latitudes = rng.uniform(-5, 1, buses), rng.uniform(50, 56, buses)
+    buses_data = [(int(bus_id), f"Bus {bus_id}", float(rng.choice([132, 275, 400])), float(longitude), float(latitude))
+                  for bus_id, longitude, latitude in zip(bus_ids, longitudes, latitudes)]
+
+    # Wind and solar profiles shared by groups of about ten buses
+    profile_count = max(1, buses // 10)
+    wind = np.clip(0.4 + 0.1 * np.cumsum(rng.normal(0, 0.3, (snapshots, profile_count)), axis=0) % 0.6, 0, 1)
+    daylight = np.clip(np.sin(np.pi * (hours - 6) / 12), 0, None)[:, None]
+    solar = daylight * rng.uniform(0.5, 1, (snapshots // 24 + 1, profile_count)).repeat(24, axis=0)[:snapshots]
+    wind_profile_data = [(f"Wind {j}", time, float(wind[t, j])) for j in range(profile_count) for t, time in enumerate(times)]
+    solar_profile_data = [(f"Solar {j}", time, float(solar[t, j])) for j in range(profile_count) for t, time in enumerate(times)]
+
+    # Plants, each bus starting at a different point in the cycle of types
+    power_plants_data = []
+    firm_capacity = 0.0
+    for bus_id in bus_ids:
+        for k in range(plants_per_bus):
+            plant_type, srmc = PLANT_TYPES[(bus_id + k) % len(PLANT_TYPES)]
+            capacity = float(rng.uniform(50, 500))
+            profile = f"{plant_type} {bus_id % profile_count}" if plant_type in PROFILED_TYPES else None
+            firm_capacity += capacity if plant_type not in PROFILED_TYPES else 0
+            power_plants_data.append((f"Plant {bus_id}-{k + 1}", capacity, int(bus_id), plant_type, float(srmc * rng.uniform(0.9, 1.1)), profile))
+
+    # Demand peaking in the early evening, its total peak half the firm capacity (all of it at buses without any)
+    shape = 0.7 + 0.3 * np.sin(np.pi * (hours - 11) / 12).clip(0)
+    shares = rng.uniform(0.5, 1.5, buses)
+    peak = 0.5 * max(firm_capacity, 100 * buses) * shares / shares.sum()
+    demand = shape[:, None] * peak[None, :] * rng.uniform(0.95, 1.05, (snapshots, buses))
+    demand_data = [(int(bus_ids[b]), float(demand[t, b]), time) for t, time in enumerate(times) for b in range(buses)]
+
+    # Lines: a random spanning tree, so every bus is connected, plus one extra line for every five buses.  Each can
+    # carry the whole system's peak demand, so transmission never makes a network infeasible.
+    pairs = [(int(bus_ids[rng.integers(0, b)]), int(bus_ids[b])) for b in range(1, buses)]
+    pairs += [tuple(int(bus_id) for bus_id in rng.choice(bus_ids, 2, replace=False)) for _ in range(buses // 5)] if buses > 2 else []
+    lines_data = []
+    for i, (from_bus, to_bus) in enumerate(pairs, start=1):
+        length = float(np.hypot(longitudes[from_bus - 1] - longitudes[to_bus - 1], latitudes[from_bus - 1] - latitudes[to_bus - 1]) * 80 + 10)
+        lines_data.append((f"Line {i}", from_bus, to_bus, length, float(peak.sum() * 1.05), 0.0001 * length, 0.0004 * length))
+
+    storage_units_data = [(f"Storage {i}", float(capacity), float(capacity * 4), int(bus_id), 0.9, "Battery")
+                          for i, (capacity, bus_id) in enumerate(zip(rng.uniform(50, 300, storage_units), rng.choice(bus_ids, storage_units)), start=1)]
+
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.cursor()
+        create_schema(cursor)
+        cursor.executemany('INSERT INTO buses (id, name, voltage_kv, longitude, latitude) VALUES (?, ?, ?, ?, ?)', buses_data)
+        cursor.executemany('INSERT INTO power_plants (name, capacity_mw, bus_id, type, srmc, profile) VALUES (?, ?, ?, ?, ?, ?)', power_plants_data)
+        cursor.executemany('INSERT INTO lines (name, from_bus, to_bus, length_km, max_capacity_mw, r, x) VALUES (?, ?, ?, ?, ?, ?, ?)', lines_data)
+        cursor.executemany('INSERT INTO demand_profile (bus_id, demand_mw, snapshot) VALUES (?, ?, ?)', demand_data)
+        cursor.executemany('INSERT INTO storage_units (name, capacity_mw, max_energy_mwh, bus_id, efficiency, type) VALUES (?, ?, ?, ?, ?, ?)', storage_units_data)
+        cursor.executemany('INSERT INTO snapshots (snapshot_time, weight) VALUES (?, 1.0)', [(time,) for time in times])
+        cursor.executemany('INSERT INTO wind_profile (profile_name, snapshot_time, profile) VALUES (?, ?, ?)', wind_profile_data)
+        cursor.executemany('INSERT INTO solar_profile (profile_name, snapshot_time, profile) VALUES (?, ?, ?)', solar_profile_data)
+        conn.commit()
+    finally:
+        conn.close()
+
+def benchmark_size(size, solver_name='highs', seed=0):
+    # Times each stage of the pipeline - loading, building the network, the capacity check, the network diagram,
+    # the optimization (with its own stages) and the result charts - on a synthetic network of the given size
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        path = os.path.join(directory, 'benchmark.db')
+        generate_network_database(path, seed=seed, **size)
+
+        with record_stages() as stages:
+            with track_stage('load_data'):
+                tables = load_data(path)
+            with track_stage('create_network'):
+                network = create_network(*tables)
+            with track_stage('check_nodal_capacity_vs_demand'):
+                check_nodal_capacity_vs_demand(network)
+            with track_stage('get_network_elements_from_df'):
+                get_network_elements_from_df(path)
+            with track_stage('run_optimization'):
+                optimization_results = run_optimization(network, solver_name=solver_name)
+            if optimization_results is None:
+                return {'size': size, 'status': 'failed', 'stages': summarize_stages(stages), 'lp': None}
+            with track_stage('generate_result_charts'):
+                generate_result_charts(optimization_results)
+
+    instrumentation = optimization_results['instrumentation']
+    optimization_stages = [dict(stage, stage=f"run_optimization: {stage['stage']}") for stage in instrumentation['stages']]
+    return {
+        'size': size,
+        'status': optimization_results['solver'].get('status', 'ok'),
+        'objective': float(network.objective) if network.objective is not None else None,
+        'stages': summarize_stages(stages + optimization_stages),
+        'lp': instrumentation['lp']
+    }
+
+def run_benchmark(sizes=None, solver_name='highs', seed=0):
+    # Benchmarks each size (default BENCHMARK_SIZES) in turn: {'solver', 'versions', 'machine', 'runs': {size name: run}}
+    runs = {}
+    for size in BENCHMARK_SIZES if sizes is None else sizes:
+        print(f"Benchmarking {get_size_name(size)}...")
+        runs[get_size_name(size)] = benchmark_size(size, solver_name, seed)
+    machine = {'platform': platform.platform(), 'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count()}
+    return {'solver': solver_name, 'versions': get_versions(), 'machine': machine, 'runs': runs}
+
+def compare_to_baseline(benchmark, baseline, tolerance=None, min_seconds=None):
+    # Rows of (size, stage, baseline seconds, seconds, ratio, regressed) for every stage timed in both, a stage
+    # regressing when it is more than 'tolerance' times slower and at least 'min_seconds' slower than the baseline
+    tolerance = BENCHMARK_TOLERANCE if tolerance is None else tolerance
+    min_seconds = BENCHMARK_MIN_SECONDS if min_seconds is None else min_seconds
+    rows = []
+    for size_name, run in benchmark['runs'].items():
+        baseline_stages = {stage['stage']: stage for stage in baseline.get('runs', {}).get(size_name, {}).get('stages', [])}
+        for stage in run['stages']:
+            baseline_stage = baseline_stages.get(stage['stage'])
+            if baseline_stage is None:
+                continue
+            before, after = baseline_stage['wall_time'], stage['wall_time']
+            ratio = after / before if before > 0 else float('inf')
+            rows.append((size_name, stage['stage'], before, after, ratio, ratio > tolerance and after - before >= min_seconds))
+    return rows
+
+def print_benchmark(benchmark, rows=None):
+    for size_name, run in benchmark['runs'].items():
+        print(f"\n{size_name} ({run['status']})")
+        if run['lp']:
+            print(f"  LP: {run['lp']['variables']:,} variables, {run['lp']['constraints']:,} constraints, {run['lp']['nonzeros']:,} nonzeros")
+        compared = {row[1]: row for row in rows or [] if row[0] == size_name}
+        for stage in run['stages']:
+            peak = f"{stage['peak_rss_mb']:.0f} MB" if stage['peak_rss_mb'] is not None else "-"
+            line = f"  {stage['stage']:<45} {stage['wall_time']:8.2f} s wall {stage['cpu_time']:8.2f} s CPU {peak:>8}"
+            if stage['stage'] in compared:
+                _, _, before, _, ratio, regressed = compared[stage['stage']]
+                line += f"   baseline {before:8.2f} s  x{ratio:5.2f}{'  REGRESSION' if regressed else ''}"
+            print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the build, solve and chart pipeline on synthetic networks of increasing size")
+    parser.add_argument('--size', type=int, nargs=4, action='append', metavar=('BUSES', 'PLANTS_PER_BUS', 'STORAGE_UNITS', 'SNAPSHOTS'),
+                        help="Network size to benchmark (repeat for several; default: BENCHMARK_SIZES)")
+    parser.add_argument('--solver', default='highs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="Save these timings as the new baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE)
+    parser.add_argument('--min-seconds', type=float, default=BENCHMARK_MIN_SECONDS)
+    args = parser.parse_args()
+
+    sizes = [dict(zip(['buses', 'plants_per_bus', 'storage_units', 'snapshots'], size)) for size in args.size] if args.size else None
+    benchmark = run_benchmark(sizes, args.solver, args.seed)
+
+    if args.save_baseline:
+        print_benchmark(benchmark)
+        with open(args.baseline, 'w') as f:
+            json.dump(benchmark, f, indent=2, default=str)
+        print(f"\nBaseline written to {args.baseline}")
+        sys.exit(0)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    rows = compare_to_baseline(benchmark, baseline, args.tolerance, args.min_seconds) if baseline else []
+    print_benchmark(benchmark, rows)
+
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline} (run with --save-baseline to record one)")
+    else:
+        if baseline.get('versions') != benchmark['versions']:
+            print(f"\nNote: the baseline was recorded with {baseline.get('versions')}")
+        if baseline.get('machine') != benchmark['machine']:
+            print(f"\nNote: the baseline was recorded on another machine ({baseline.get('machine')})")
+
+    regressions = [row for row in rows if row[5]]
+    failed = [size_name for size_name, run in benchmark['runs'].items() if run['status'] == 'failed']
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than the baseline by more than x{args.tolerance}")
+    if failed:
+        print(f"\nOptimization failed for: {', '.join(failed)}")
+    sys.exit(1 if regressions or failed else 0)
@@ -2,56 +2,553 @@ import pypsa
 import pandas as pd
 import numpy as np
 import sqlite3
+import glob
 import json
+import os
+import re
+import time
+import zipfile
 
 import threading
 import logging
 import sys
-from io import StringIO
+from contextlib import contextmanager
+from io import BytesIO, RawIOBase, TextIOWrapper
 from queue import Queue, Empty
 
-# Global stream for capturing logs
-log_stream = StringIO()
-interval_disabled = False
+try:
+    import python_calamine  # noqa: F401  (fast, read-only Excel reader)
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
+from profile_store import PROFILE_TABLES, pa, store_enabled, get_store_dir, read_profile_table, write_profile_matrix
+from solvers import solve_network, get_available_solvers, get_solver_options
+from time_aggregation import aggregate_representative_days, resample_time_series, combine_calendars, expand_to_calendar
+from network_reduction import disaggregate_results
+from model_reuse import REUSE_MODEL, get_model, solve_model
+from instrumentation import track_peak_memory, track_stage, record_stages, get_run_instrumentation
+from result_format import RESULT_DTYPE, compact_results, results_to_dict
+from result_cache import RESULT_CACHE_MB, fingerprint_network, get_cached_result, store_result
+
+logger = logging.getLogger(__name__)
+
+# Cache of built networks, one entry per database keyed by its version and file state
+network_cache = {}
+network_cache_stats = {'hits': 0, 'misses': 0}
+database_versions = {}
+network_cache_lock = threading.Lock()
+
+# Open SQLite connections, one per database for each thread (and process)
+db_connections = threading.local()
+
+# Database schema version, stored in PRAGMA user_version (see migrate_database)
+SCHEMA_VERSION = 2
+
+# Timestamp column of each time-series table, stored as integer seconds since the epoch
+TIME_COLUMNS = {
+    'demand_profile': 'snapshot',
+    'snapshots': 'snapshot_time',
+    'wind_profile': 'snapshot_time',
+    'solar_profile': 'snapshot_time'
+}
+
+# Secondary indexes on the time-series tables
+TABLE_INDEXES = {
+    'demand_profile': ('idx_demand_profile_snapshot_bus', ['snapshot', 'bus_id']),
+    'snapshots': ('idx_snapshots_time', ['snapshot_time']),
+    'wind_profile': ('idx_wind_profile_name_time', ['profile_name', 'snapshot_time']),
+    'solar_profile': ('idx_solar_profile_name_time', ['profile_name', 'snapshot_time'])
+}
 
 def connect_to_db(DATABASE_PATH):
-    return sqlite3.connect(DATABASE_PATH)
+    # Returns this thread's connection to the database, opening it on first use.  Connections are
+    # reused between calls, so callers must not close them.
+    if getattr(db_connections, 'pid', None) != os.getpid():
+        # New thread, or a forked worker process that must not share its parent's connections
+        db_connections.pid = os.getpid()
+        db_connections.connections = {}
 
-def load_data(DATABASE_PATH):
+    path = os.path.abspath(DATABASE_PATH)
+    conn = db_connections.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers see a consistent snapshot while a writer is active
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, avoids an fsync on every commit
+        conn.execute("PRAGMA mmap_size=268435456")  # Memory-map up to 256 MB of the database file
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+        conn.execute("PRAGMA temp_store=MEMORY")
+        migrate_database(conn)
+        db_connections.connections[path] = conn
+    return conn
+
+def migrate_database(conn):
+    # Brings a database created by an older version of the app up to SCHEMA_VERSION.
+    # Version 1: timestamps stored as epoch seconds in INTEGER columns, and indexes on the time-series tables.
+    # Version 2: table_versions, a change counter per table bumped by every save.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if version < 1:
+            for table_name, column in TIME_COLUMNS.items():
+                table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+                if table_sql is None:
+                    continue
+
+                # Recreate the table with the timestamp column declared as INTEGER, converting the stored text once
+                df = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn)
+                df[column] = _to_epoch_seconds(df[column])
+                conn.execute(f'DROP TABLE "{table_name}"')
+                conn.execute(re.sub(rf'("?{column}"?\s+)\w+', r'\1INTEGER', table_sql[0], count=1))
+                _insert_rows(conn, table_name, df)
+
+        if version < 2:
+            conn.execute("CREATE TABLE IF NOT EXISTS table_versions (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)")
+
+        create_indexes(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def get_table_version(conn, table_name):
+    row = conn.execute("SELECT version FROM table_versions WHERE table_name = ?", (table_name,)).fetchone()
+    return row[0] if row else 0
+
+def _bump_table_version(conn, table_name):
+    # Called inside the transaction that changes the table
+    conn.execute("INSERT INTO table_versions (table_name, version) VALUES (?, 1) "
+                 "ON CONFLICT(table_name) DO UPDATE SET version = version + 1", (table_name,))
+
+def create_indexes(conn):
+    # Creates any missing secondary indexes on the tables that exist
+    existing_tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table_name, (index_name, columns) in TABLE_INDEXES.items():
+        if table_name in existing_tables:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON "{table_name}" ({", ".join(columns)})')
+
+def _to_epoch_seconds(values):
+    # Converts timestamps (datetimes, or text as previously stored and edited) to integer seconds since the epoch
+    if not pd.api.types.is_numeric_dtype(values):
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = _parse_timestamps(pd.Series(values))
+        values = (values - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+    return values.astype('int64')
+
+def _parse_timestamps(values):
+    # Text timestamps are ISO 8601 ("2030-01-02T06:00:00", as the editor tables send datetimes back) or the
+    # dd/mm/yyyy text stored before schema version 1.  Only the latter is read day first: day first ISO text
+    # would swap the day and month.
+    iso = values.astype('string').str.match(r'\s*\d{4}-\d{2}-\d{2}').fillna(False).to_numpy(dtype=bool)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if iso.any():
+        parsed[iso] = pd.to_datetime(values[iso], format='ISO8601').astype('datetime64[ns]')
+    if (~iso).any():
+        parsed[~iso] = pd.to_datetime(values[~iso], dayfirst=True).astype('datetime64[ns]')
+    return parsed
+
+def _from_epoch_seconds(df, table_name):
+    # Returns the table's timestamp column as datetimes (no string parsing needed)
+    column = TIME_COLUMNS.get(table_name)
+    if column in df.columns:
+        df[column] = pd.to_datetime(df[column], unit='s').astype('datetime64[ns]')
+    return df
+
+@contextmanager
+def read_transaction(DATABASE_PATH):
+    # Runs the enclosed reads against one consistent snapshot of the database without blocking writers
     conn = connect_to_db(DATABASE_PATH)
-    power_plants_df = pd.read_sql_query("SELECT * FROM power_plants", conn)
-    buses_df = pd.read_sql_query("SELECT * FROM buses", conn)
-    lines_df = pd.read_sql_query("SELECT id, name, from_bus, to_bus, length_km, max_capacity_mw, r, x FROM lines", conn)
-    demand_df = pd.read_sql_query("SELECT * FROM demand_profile", conn)
-    storage_units_df = pd.read_sql_query("SELECT * FROM storage_units", conn)
-    snapshots_df = pd.read_sql_query("SELECT * FROM snapshots", conn)
-    wind_profile_df = pd.read_sql_query("SELECT * FROM wind_profile", conn)
-    solar_profile_df = pd.read_sql_query("SELECT * FROM solar_profile", conn)
-    conn.close()
-    return power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df 
+    if conn.in_transaction:
+        yield conn
+        return
+
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()  # Nothing was written, so just end the read transaction
+
+# Columns read for each table (all columns unless listed here)
+TABLE_QUERIES = {
+    'lines': "SELECT id, name, from_bus, to_bus, length_km, max_capacity_mw, r, x FROM lines"
+}
+
+# Rows and bytes read from the database, per thread, since the last call to reset_read_stats
+read_stats = threading.local()
+
+def reset_read_stats():
+    read_stats.tables = {}
+
+def get_read_stats():
+    # Returns {table name: (rows, bytes)} read since reset_read_stats
+    return dict(getattr(read_stats, 'tables', {}))
+
+def _record_read(table_name, df):
+    if not hasattr(read_stats, 'tables'):
+        reset_read_stats()
+    rows, n_bytes = read_stats.tables.get(table_name, (0, 0))
+    read_stats.tables[table_name] = (rows + len(df), n_bytes + int(df.memory_usage(deep=True).sum()))
+
+def _read_table(conn, table_name):
+    df = _from_epoch_seconds(pd.read_sql_query(TABLE_QUERIES.get(table_name, f"SELECT * FROM {table_name}"), conn), table_name)
+    _record_read(table_name, df)
+    return df
+
+def load_data(DATABASE_PATH):
+    return load_tables(DATABASE_PATH, 'power_plants', 'buses', 'lines', 'demand_profile', 'storage_units', 'snapshots', 'wind_profile', 'solar_profile')
+
+def load_tables(DATABASE_PATH, *table_names):
+    # Reads only the named tables, from one consistent snapshot of the database, so pages and callbacks
+    # don't pay for the large time-series tables they don't use.  Profile tables may come from the
+    # columnar store (with renumbered ids), so use load_data_table for tables that will be edited.
+    with read_transaction(DATABASE_PATH) as conn:
+        return tuple(_load_profile_table(DATABASE_PATH, conn, table_name) if table_name in PROFILE_TABLES
+                     else _read_table(conn, table_name)
+                     for table_name in table_names)
+
+def _load_profile_table(DATABASE_PATH, conn, table_name):
+    # Profile tables come from the columnar store when it is set up and up to date with the database,
+    # otherwise from SQLite (refreshing the store for next time)
+    if not store_enabled(DATABASE_PATH):
+        return _read_table(conn, table_name)
+
+    version = get_table_version(conn, table_name)
+    df = read_profile_table(DATABASE_PATH, table_name, version=version)
+    if df is None:
+        df = _read_table(conn, table_name)
+        write_profile_matrix(DATABASE_PATH, table_name, df, version)
+    else:
+        _record_read(table_name, df)
+    return df
+
+def build_profile_store(DATABASE_PATH):
+    # Sets up the columnar profile store next to the database and fills it from the profile tables.
+    # From then on load_data reads the profiles from it, and refreshes it after they are saved.
+    if pa is None:
+        raise ImportError("pyarrow is required for the columnar profile store")
+    os.makedirs(get_store_dir(DATABASE_PATH), exist_ok=True)
+    with read_transaction(DATABASE_PATH) as conn:
+        for table_name in PROFILE_TABLES:
+            write_profile_matrix(DATABASE_PATH, table_name, _read_table(conn, table_name), get_table_version(conn, table_name))
 
 def load_data_for_diagram(DATABASE_PATH):
-    conn = connect_to_db(DATABASE_PATH)
-    power_plants_df = pd.read_sql_query("SELECT * FROM power_plants", conn)
-    buses_df = pd.read_sql_query("SELECT * FROM buses", conn).set_index('id')
-    lines_df = pd.read_sql_query("SELECT id, name, from_bus, to_bus, length_km, max_capacity_mw, r, x FROM lines", conn)
-    storage_units_df = pd.read_sql_query("SELECT * FROM storage_units", conn)
-    conn.close()
-    return power_plants_df, buses_df, lines_df, storage_units_df
+    power_plants_df, buses_df, lines_df, storage_units_df = load_tables(DATABASE_PATH, 'power_plants', 'buses', 'lines', 'storage_units')
+    return power_plants_df, buses_df.set_index('id'), lines_df, storage_units_df
 
 def load_data_table(DATABASE_PATH, table):
+    # Reads one table straight from the database (never the profile store), keeping the row ids for saving edits
     conn = connect_to_db(DATABASE_PATH)
-    df = pd.read_sql_query("SELECT * FROM " + str(table), conn)
-    conn.close()
-    return df 
+    return _read_table(conn, str(table))
+
+# Sheets of the network workbook (as downloaded and uploaded from the sidebar) and the tables they hold
+NETWORK_SHEETS = {
+    'Power Plants': 'power_plants',
+    'Buses': 'buses',
+    'Transmission Lines': 'lines',
+    'Demand Profile': 'demand_profile',
+    'Storage Units': 'storage_units',
+    'Snapshots': 'snapshots',
+    'Wind Profile': 'wind_profile',
+    'Solar Profile': 'solar_profile'
+}
+
+def read_network_workbook(file):
+    # Parses the network workbook (a path or file-like object, e.g. an in-memory upload) into {table name: dataframe}
+    tables = {}
+    with pd.ExcelFile(file, engine=EXCEL_ENGINE) as xls:
+        for sheet_name, table_name in NETWORK_SHEETS.items():
+            start_time = time.perf_counter()
+            tables[table_name] = xls.parse(sheet_name)
+            logger.info("Read sheet '%s' (%d rows) in %.3fs", sheet_name, len(tables[table_name]), time.perf_counter() - start_time)
+    return tables
+
+# Formats that stream_network_archive can write (Parquet needs pyarrow)
+EXPORT_FORMATS = ['csv', 'parquet'] if pa is not None else ['csv']
+
+class _StreamBuffer(RawIOBase):
+    # Write-only stream that hands back whatever has been written since the last take(), so a zip file
+    # can be sent while it is still being built
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def stream_network_archive(DATABASE_PATH, export_format, chunk_rows=50000):
+    # Yields a zip file with one CSV or Parquet file per table, reading and sending one table (and, for CSV,
+    # one chunk of rows) at a time so the whole network is never held in memory
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table_name in NETWORK_SHEETS.values():
+            df = load_data_table(DATABASE_PATH, table_name)
+            if export_format == 'csv':
+                with archive.open(f'{table_name}.csv', 'w') as entry, TextIOWrapper(entry, encoding='utf-8', newline='') as text:
+                    for start in range(0, max(len(df), 1), chunk_rows):
+                        df.iloc[start:start + chunk_rows].to_csv(text, index=False, header=start == 0)
+                        text.flush()
+                        yield buffer.take()
+            else:
+                table_buffer = BytesIO()
+                df.to_parquet(table_buffer, index=False)
+                archive.writestr(f'{table_name}.parquet', table_buffer.getvalue(), compress_type=zipfile.ZIP_STORED)  # Already compressed
+                yield buffer.take()
+    yield buffer.take()
+
+def import_network_workbook(DATABASE_PATH, file):
+    # Replaces the whole network with the contents of the workbook, writing every table in one transaction
+    tables = read_network_workbook(file)
+
+    start_time = time.perf_counter()
+    replace_tables(DATABASE_PATH, tables)
+    logger.info("Saved %d tables (%d rows) in %.3fs", len(tables), sum(len(df) for df in tables.values()), time.perf_counter() - start_time)
 
 
 def save_data(DATABASE_PATH, table_name, df):
-    # Saves the provided dataframe 'df' into the table 'table_name' in the database located at DATABASE_PATH
+    # Saves the provided dataframe 'df' into the table 'table_name' in the database located at DATABASE_PATH.
+    # Rows are matched on 'id' and only inserted, modified and deleted rows are written, in one transaction.
+    # Falls back to replacing the whole table when it doesn't exist yet, its columns have changed or the ids
+    # can't be used as a key.
+    start_time = time.perf_counter()
+    conn = connect_to_db(DATABASE_PATH)
+    df = _to_sql_values(df, table_name)
+
+    existing_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    if not existing_columns or set(existing_columns) != set(df.columns) or not _ids_are_key(conn, table_name, df):
+        replace_tables(DATABASE_PATH, {table_name: df})
+        logger.info("save_data: replaced %s (%d rows) in %.3fs", table_name, len(df), time.perf_counter() - start_time)
+        return {'inserted': len(df), 'updated': 0, 'deleted': 0}
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")  # Take the write lock before reading, so the diff can't go stale
+
+        incoming = df[existing_columns].set_axis(pd.to_numeric(df['id']).astype('int64'), axis=0)
+        existing = pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn).set_index('id', drop=False)
+
+        deleted_ids = existing.index.difference(incoming.index)
+        inserted = incoming.loc[incoming.index.difference(existing.index)]
+        common_ids = incoming.index.intersection(existing.index)
+        updated = incoming.loc[common_ids][_changed_rows(existing.loc[common_ids], incoming.loc[common_ids])]
+
+        update_columns = [column for column in existing_columns if column != 'id']
+        set_clause = ', '.join(f'"{column}" = ?' for column in update_columns)
+
+        conn.executemany(f'DELETE FROM "{table_name}" WHERE id = ?', [(int(i),) for i in deleted_ids])
+        _insert_rows(conn, table_name, inserted)
+        conn.executemany(f'UPDATE "{table_name}" SET {set_clause} WHERE id = ?', _sql_rows(updated[update_columns + ['id']]))
+        if len(deleted_ids) or len(inserted) or len(updated):
+            _bump_table_version(conn, table_name)
+
+    if len(deleted_ids) or len(inserted) or len(updated):
+        invalidate_network_cache(DATABASE_PATH)
+
+    logger.info("save_data: %s %d inserted, %d updated, %d deleted in %.3fs",
+                table_name, len(inserted), len(updated), len(deleted_ids), time.perf_counter() - start_time)
+    return {'inserted': len(inserted), 'updated': len(updated), 'deleted': len(deleted_ids)}
+
+def replace_tables(DATABASE_PATH, tables):
+    # Replaces the contents of several tables ({table name: dataframe}) in one transaction, so readers see
+    # either all of the old tables or all of the new ones
+    conn = connect_to_db(DATABASE_PATH)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table_name, df in tables.items():
+            _replace_table_contents(conn, table_name, _to_sql_values(df, table_name))
+            _bump_table_version(conn, table_name)
+        create_indexes(conn)
+    invalidate_network_cache(DATABASE_PATH)
+
+def _replace_table_contents(conn, table_name, df):
+    # Tables whose columns are unchanged keep their schema (keys, defaults and indexes) and just have their rows
+    # replaced.  Otherwise, or if the rows break the existing constraints, the table is recreated from the dataframe.
+    existing_columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    if existing_columns and set(existing_columns) == set(df.columns):
+        conn.execute("SAVEPOINT keep_schema")
+        try:
+            conn.execute(f'DELETE FROM "{table_name}"')
+            _insert_rows(conn, table_name, df[existing_columns])
+            conn.execute("RELEASE keep_schema")
+            return
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK TO keep_schema")
+            conn.execute("RELEASE keep_schema")
+
+    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+    conn.execute(pd.io.sql.get_schema(df, table_name, con=conn))
+    _insert_rows(conn, table_name, df)
+
+def _ids_are_key(conn, table_name, df):
+    # True if 'id' uniquely identifies the rows of both the saved dataframe and the existing table
+    if 'id' not in df.columns:
+        return False
+    ids = pd.to_numeric(df['id'], errors='coerce')
+    if ids.isna().any() or (ids % 1 != 0).any() or ids.duplicated().any():
+        return False
+    total, distinct_ids = conn.execute(f'SELECT COUNT(*), COUNT(DISTINCT id) FROM "{table_name}"').fetchone()
+    return total == distinct_ids
+
+def _to_sql_values(df, table_name):
+    # Timestamp columns of the time-series tables are stored as epoch seconds, and other datetime columns
+    # as text in the same format that df.to_sql writes them
+    df = df.copy()
+    for column in df.columns:
+        if column == TIME_COLUMNS.get(table_name):
+            df[column] = _to_epoch_seconds(df[column])
+        elif pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].map(lambda value: value.isoformat(' ') if pd.notna(value) else None)
+    return df
+
+def _insert_rows(conn, table_name, df):
+    column_list = ', '.join(f'"{column}"' for column in df.columns)
+    placeholders = ', '.join('?' for _ in df.columns)
+    conn.executemany(f'INSERT INTO "{table_name}" ({column_list}) VALUES ({placeholders})', _sql_rows(df))
+
+def _sql_rows(df):
+    # Plain Python values (None for missing) that sqlite3 can bind
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def _changed_rows(existing, incoming):
+    # Flags the rows of 'incoming' that differ from 'existing' (same index) in any column
+    changed = pd.Series(False, index=incoming.index)
+    for column in incoming.columns:
+        old, new = existing[column], incoming[column]
+        if pd.api.types.is_numeric_dtype(old) and not pd.api.types.is_bool_dtype(old):
+            # Edited cells can come back from the browser as text, so compare numerically
+            new_numeric = pd.to_numeric(new, errors='coerce')
+            same = (old == new_numeric) | (old.isna() & new.isna())
+        else:
+            same = (old.astype(str) == new.astype(str)) | (old.isna() & new.isna())
+        changed |= ~same
+    return changed.values
+
+def get_database_key(DATABASE_PATH):
+    # Version counter bumped by our own saves plus the file state, so edits made outside the app are also picked up
+    files = [DATABASE_PATH, DATABASE_PATH + '-wal']
+    file_state = tuple((os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in files if os.path.exists(f))
+    return (os.path.abspath(DATABASE_PATH), database_versions.get(os.path.abspath(DATABASE_PATH), 0), file_state)
+
+def invalidate_network_cache(DATABASE_PATH):
+    path = os.path.abspath(DATABASE_PATH)
+    with network_cache_lock:
+        database_versions[path] = database_versions.get(path, 0) + 1
+        network_cache.pop(path, None)
+
+def get_network(DATABASE_PATH, copy=False):
+    # Returns the network built from the current database, building it only if the database has changed.
+    # Use copy=True when the caller modifies the network (e.g. optimization) so the cached one stays clean.
+    with network_cache_lock:
+        # Opening the first connection switches the database to WAL and creates the -wal file, so do it before
+        # taking the key, or the key changes under the first network built
+        connect_to_db(DATABASE_PATH)
+        key = get_database_key(DATABASE_PATH)
+        cached = network_cache.get(key[0])
+        if cached is not None and cached[0] == key:
+            network_cache_stats['hits'] += 1
+            network = cached[1]
+        else:
+            network_cache_stats['misses'] += 1
+            with track_stage('load_data'):
+                tables = load_data(DATABASE_PATH)
+            with track_stage('create_network'):
+                network = create_network(*tables)
+            network_cache[key[0]] = (key, network)
+        logger.debug("Network cache: %d hits, %d misses", network_cache_stats['hits'], network_cache_stats['misses'])
+
+        # Copied under the lock, so another thread can't replace or change the cached network while it is copied
+        return network.copy() if copy else network
+
+def get_aggregated_network(DATABASE_PATH, representative_days=0, method='kmeans', resolution_hours=1):
+    # Builds a network over fewer snapshots than the full calendar: resampled to one snapshot every
+    # 'resolution_hours' hours and/or reduced to 'representative_days' clustered days (see time_aggregation).
+    # The mapping back to the calendar travels with the network, so run_optimization returns full-calendar results.
+    start_time = time.perf_counter()
+    with track_stage('load_data'):
+        power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df = load_data(DATABASE_PATH)
+
+    calendar = None
+    if resolution_hours > 1:
+        demand_df, snapshots_df, wind_profile_df, solar_profile_df, calendar = resample_time_series(
+            demand_df, snapshots_df, wind_profile_df, solar_profile_df, resolution_hours)
+
+    # Storage balances use how long each snapshot lasts, not how many days it stands for
+    durations = None
+    if 'weight' in snapshots_df:
+        durations = pd.Series(snapshots_df['weight'].fillna(1).to_numpy(dtype=float), index=pd.to_datetime(snapshots_df['snapshot_time'], dayfirst=True).values)
+
+    if representative_days:
+        demand_df, snapshots_df, wind_profile_df, solar_profile_df, day_calendar = aggregate_representative_days(
+            demand_df, snapshots_df, wind_profile_df, solar_profile_df, representative_days, method)
+        calendar = combine_calendars(calendar, day_calendar) if calendar else day_calendar
+
+    with track_stage('create_network'):
+        network = create_network(power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df)
+
+    # Storage runs through the representative days in calendar order, one snapshot's duration at a time
+    if representative_days and durations is not None:
+        network.snapshot_weightings['stores'] = durations.reindex(network.snapshots).fillna(1).to_numpy()
+    if calendar:
+        network.meta['calendar'] = calendar
+
+    logger.info("Aggregated network built in %.2f s (%d snapshots)", time.perf_counter() - start_time, len(network.snapshots))
+    return network
+
+def scale_plant_capacities(DATABASE_PATH, new_capacities):
+    # Scales every plant of each type so the type totals match new_capacities ({type: total MW}).
+    # Only the rows of changed types are updated, and the cached network is patched in place rather than rebuilt.
     conn = connect_to_db(DATABASE_PATH)
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
-    conn.commit()
-    conn.close()
+    current_capacities = dict(conn.execute("SELECT type, SUM(capacity_mw) FROM power_plants GROUP BY type").fetchall())
+
+    # Types with no capacity left cannot be scaled back up, so they are skipped.  The slider totals (GW) only match
+    # the stored totals (MW) to within rounding, so factors that are effectively 1 are skipped too, rather than
+    # writing unchanged rows and invalidating the cached network.
+    factors = {plant_type: new_capacity / current_capacities[plant_type]
+               for plant_type, new_capacity in new_capacities.items()
+               if current_capacities.get(plant_type)}
+    factors = {plant_type: factor for plant_type, factor in factors.items() if not np.isclose(factor, 1)}
+    if not factors:
+        return factors
+
+    with network_cache_lock:
+        path = os.path.abspath(DATABASE_PATH)
+        cached = network_cache.get(path)
+        cache_is_current = cached is not None and cached[0] == get_database_key(DATABASE_PATH)
+
+        with conn:
+            conn.executemany("UPDATE power_plants SET capacity_mw = capacity_mw * ? WHERE type = ?",
+                             [(factor, plant_type) for plant_type, factor in factors.items()])
+            _bump_table_version(conn, 'power_plants')
+        database_versions[path] = database_versions.get(path, 0) + 1
+
+        if cache_is_current:
+            network = cached[1]
+            for plant_type, factor in factors.items():
+                network.generators.loc[network.generators['type'] == plant_type, 'p_nom'] *= factor
+            network_cache[path] = (get_database_key(DATABASE_PATH), network)
+        else:
+            network_cache.pop(path, None)
+
+    return factors
+
+def get_bus_name_map(buses_df):
+    # Map bus id -> bus name once so components don't each scan buses_df
+    return pd.Series(buses_df['name'].values, index=buses_df['id'].astype(int)).to_dict()
+
+def _map_bus_ids(bus_ids, bus_names):
+    # Resolve a column of bus ids to bus names (NaN where the bus does not exist)
+    return bus_ids.astype(int).map(bus_names)
+
+def pivot_profiles(profile_df, snapshots):
+    # Pivot a long profile table (profile_name, snapshot_time, profile) into a snapshots x profile_name matrix
+    profile_df = profile_df.dropna(subset=['snapshot_time'])
+    return profile_df.pivot(index='snapshot_time', columns='profile_name', values='profile').reindex(snapshots)
 
 def create_network(power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df):
     network = pypsa.Network()  # Create a PyPSA Network
@@ -59,114 +556,116 @@ def create_network(power_plants_df, buses_df, lines_df, demand_df, storage_units
     # Add snapshots to the network
     network.set_snapshots(pd.to_datetime(snapshots_df['snapshot_time'], dayfirst=True))
 
-    solar_profile_df.index = pd.to_datetime(solar_profile_df.index, dayfirst=True)
-    wind_profile_df.index = pd.to_datetime(wind_profile_df.index, dayfirst=True)
+    # Each snapshot stands for 'weight' hours in the objective, the generation totals and the storage balance
+    if 'weight' in snapshots_df:
+        weights = snapshots_df['weight'].fillna(1).to_numpy(dtype=float)
+        for column in network.snapshot_weightings.columns:
+            network.snapshot_weightings[column] = weights
 
     solar_profile_df['snapshot_time'] = pd.to_datetime(solar_profile_df['snapshot_time'], errors='coerce', dayfirst=True)
     wind_profile_df['snapshot_time'] = pd.to_datetime(wind_profile_df['snapshot_time'], errors='coerce', dayfirst=True)
 
+    # Pivot the renewable profiles once into a snapshots x (type, profile_name) matrix
+    profile_matrix = pd.concat(
+        [pivot_profiles(solar_profile_df, network.snapshots), pivot_profiles(wind_profile_df, network.snapshots)],
+        axis=1, keys=['Solar', 'Wind']
+    )
+
+    # Resolve bus ids to names once for all components
+    bus_names = get_bus_name_map(buses_df)
+
     # Add buses to the network
-    for _, row in buses_df.iterrows():
-        network.add("Bus", row["name"], v_nom=row["voltage_kv"],
-                    longitude=row["longitude"], latitude=row["latitude"], carrier="AC")
+    network.add("Bus", buses_df["name"].values, v_nom=buses_df["voltage_kv"].values,
+                longitude=buses_df["longitude"].values, latitude=buses_df["latitude"].values, carrier="AC")
 
     # Add power plants (generators) to the network
-    for _, row in power_plants_df.iterrows():
-        bus_name = buses_df.loc[buses_df['id'] == int(row['bus_id']), 'name']
-        if not bus_name.empty:
-            p_nom_max = row["capacity_mw"]
-
-            # Determine the generation profile
-            if row['type'] == 'Solar':
-                filtered_df = solar_profile_df[solar_profile_df['profile_name'] == row['profile']]
-            elif row['type'] == 'Wind':
-                filtered_df = wind_profile_df[wind_profile_df['profile_name'] == row['profile']]
-            else:
-                filtered_df = pd.DataFrame()
+    generators = power_plants_df.assign(bus_name=_map_bus_ids(power_plants_df['bus_id'], bus_names))
+    for row in generators[generators['bus_name'].isna()].itertuples():
+        print(f"Warning: Bus ID {row.bus_id} for generator {row.name} not found in buses_df.")
+    # Later rows overwrite earlier rows with the same name, as with network.add(..., overwrite=True)
+    generators = generators[generators['bus_name'].notna()].drop_duplicates(subset='name', keep='last')
 
-            # Validate and set the profile
-            if not filtered_df.empty and 'snapshot_time' in filtered_df.columns:
-                profile = filtered_df.set_index('snapshot_time')['profile']
-                profile = profile.reindex(network.snapshots).fillna(1)  # Align with network snapshots
-            else:
-                profile = pd.Series(1.0, index=network.snapshots)
-
-            # Add generator to the network
-            network.add(
-                "Generator",
-                row["name"],
-                bus=bus_name.values[0],
-                p_nom=p_nom_max,
-                p_max_pu=profile,
-                marginal_cost=row["srmc"],
-                type=row['type'],
-                e_sum_max=1e10,  # Temporary set to very high number.  Default value of infinity would otherwise be overwritten by 1e6 which could be binding.
-                overwrite=True
-            )
-        else:
-            print(f"Warning: Bus ID {row['bus_id']} for generator {row['name']} not found in buses_df.")
+    if not generators.empty:
+        # Look up each Solar/Wind generator's profile column; anything without a profile runs at 1.0
+        profile_keys = pd.MultiIndex.from_arrays([generators["type"].values, generators["profile"].values])
+        p_max_pu = profile_matrix.reindex(columns=profile_keys).fillna(1)
+        p_max_pu.columns = generators["name"].values
 
+        network.add(
+            "Generator",
+            generators["name"].values,
+            bus=generators["bus_name"].values,
+            p_nom=generators["capacity_mw"].values,
+            p_max_pu=p_max_pu,
+            marginal_cost=generators["srmc"].values,
+            type=generators["type"].values,
+            e_sum_max=1e10,  # Temporary set to very high number.  Default value of infinity would otherwise be overwritten by 1e6 which could be binding.
+            overwrite=True
+        )
 
     # Add storage units to the network
-    for _, row in storage_units_df.iterrows():
-        bus_name = buses_df.loc[buses_df['id'] == int(row['bus_id']), 'name']
-        if not bus_name.empty:
-            network.add(
-                "StorageUnit",
-                row["name"],
-                bus=bus_name.values[0],
-                p_nom=row["capacity_mw"],
-                e_nom=row["max_energy_mwh"],
-                efficiency_store=row["efficiency"],
-                efficiency_dispatch=row["efficiency"],
-                overwrite=True
-            )
-        else:
-            print(f"Warning: Bus ID {row['bus_id']} for storage unit {row['name']} not found in buses_df.")
+    storage_units = storage_units_df.assign(bus_name=_map_bus_ids(storage_units_df['bus_id'], bus_names))
+    for row in storage_units[storage_units['bus_name'].isna()].itertuples():
+        print(f"Warning: Bus ID {row.bus_id} for storage unit {row.name} not found in buses_df.")
+    storage_units = storage_units[storage_units['bus_name'].notna()].drop_duplicates(subset='name', keep='last')
+
+    if not storage_units.empty:
+        network.add(
+            "StorageUnit",
+            storage_units["name"].values,
+            bus=storage_units["bus_name"].values,
+            p_nom=storage_units["capacity_mw"].values,
+            e_nom=storage_units["max_energy_mwh"].values,
+            efficiency_store=storage_units["efficiency"].values,
+            efficiency_dispatch=storage_units["efficiency"].values,
+            overwrite=True
+        )
 
     # Add transmission lines to the network
-    for _, row in lines_df.iterrows():
-        bus0_name = buses_df.loc[buses_df['id'] == int(row['from_bus']), 'name']
-        bus1_name = buses_df.loc[buses_df['id'] == int(row['to_bus']), 'name']
-        if not bus0_name.empty and not bus1_name.empty:
-            network.add(
-                "Line",
-                row["name"],
-                bus0=bus0_name.values[0],
-                bus1=bus1_name.values[0],
-                length=row["length_km"],
-                s_nom=1e6 if pd.isna(row["max_capacity_mw"]) else row["max_capacity_mw"],
-                r=row["r"],
-                x=row["x"],
-                carrier="AC",
-                overwrite=True
-            )
-        else:
-            print(f"Warning: Buses for line {row['name']} not found in buses_df (from_bus: {row['from_bus']}, to_bus: {row['to_bus']}).")
+    lines = lines_df.assign(bus0_name=_map_bus_ids(lines_df['from_bus'], bus_names),
+                            bus1_name=_map_bus_ids(lines_df['to_bus'], bus_names))
+    missing_buses = lines['bus0_name'].isna() | lines['bus1_name'].isna()
+    for row in lines[missing_buses].itertuples():
+        print(f"Warning: Buses for line {row.name} not found in buses_df (from_bus: {row.from_bus}, to_bus: {row.to_bus}).")
+    lines = lines[~missing_buses].drop_duplicates(subset='name', keep='last')
+
+    if not lines.empty:
+        network.add(
+            "Line",
+            lines["name"].values,
+            bus0=lines["bus0_name"].values,
+            bus1=lines["bus1_name"].values,
+            length=lines["length_km"].values,
+            s_nom=lines["max_capacity_mw"].fillna(1e6).values,
+            r=lines["r"].values,
+            x=lines["x"].values,
+            carrier="AC",
+            overwrite=True
+        )
 
     # Add demand as loads to the network (now including snapshot timestamp)
     demand_timeseries = demand_df.pivot(index='snapshot', columns='bus_id', values='demand_mw')
 
     # Ensure snapshot alignment
     demand_timeseries.index = pd.to_datetime(demand_timeseries.index, dayfirst=True)
-    network.snapshots = pd.to_datetime(network.snapshots, dayfirst=True)
 
     # Reindex demand data to match network snapshots
     demand_timeseries = demand_timeseries.reindex(network.snapshots).fillna(0)
 
-    # Iterate over each bus to add the time series demand data as loads to the network
-    for bus_id in demand_timeseries.columns:
-        bus_name = buses_df.loc[buses_df['id'] == bus_id, 'name'].values[0]
-        if pd.notna(bus_name):
-            network.add(
-                "Load",
-                f"Load_{bus_id}",
-                bus=bus_name,
-                p_set=demand_timeseries[bus_id]  # Provide entire time series directly
-            )
-        else:
-            print(f"Warning: Bus ID {bus_id} not found in buses_df.")
+    # Add the time series demand data of every bus as loads in one call
+    load_buses = demand_timeseries.columns.to_series().map(bus_names)
+    for bus_id in load_buses[load_buses.isna()].index:
+        print(f"Warning: Bus ID {bus_id} not found in buses_df.")
+    demand_timeseries = demand_timeseries.loc[:, load_buses.notna().values]
 
+    if not demand_timeseries.empty:
+        load_names = [f"Load_{bus_id}" for bus_id in demand_timeseries.columns]
+        network.add(
+            "Load",
+            load_names,
+            bus=load_buses.dropna().values,
+            p_set=demand_timeseries.set_axis(load_names, axis=1)  # Provide entire time series directly
+        )
 
     # Replace infinities with large finite values (since some solvers cannot handle 'inf')
     network.generators.replace([np.inf], 1e6, inplace=True)
@@ -304,7 +803,7 @@ def get_network_elements_from_df(DATABASE_PATH):
             })
     
     # Storage Units
-    for _, storage in storage_units_df.itertuples():
+    for storage in storage_units_df.itertuples():
         bus = buses_df.loc[storage.bus_id]
         nodes_data.append({
             'id': 'storage'+str(storage.id),
@@ -332,9 +831,31 @@ def get_network_elements_from_df(DATABASE_PATH):
     return json.dumps(clean_data)
 
 
+def scale_network_elements(network_data, factors):
+    # Applies capacity scale factors ({type: factor}) to the diagram JSON from get_network_elements_from_df
+    # so the dashboard diagram can be updated without rereading the database
+    clean_data = json.loads(network_data)
+
+    nodes_data = []
+    removed_ids = set()
+    for node in clean_data['nodes']:
+        if node['type'] == 'generator' and node.get('fuel') in factors:
+            node['capacity'] = node['capacity'] * factors[node['fuel']]
+            node['label'] = f"{node['name']}({node['capacity']:.0f}MW)"
+            if not node['capacity'] > 0:  # Zero-capacity generators are not drawn
+                removed_ids.add(node['id'])
+                continue
+        nodes_data.append(node)
+
+    clean_data['nodes'] = nodes_data
+    clean_data['links'] = [link for link in clean_data['links'] if link['source'] not in removed_ids]
+
+    return json.dumps(clean_data)
+
+
 def calc_aggregate_capacities(DATABASE_PATH):
 
-    power_plants_df, buses_df, lines_df, storage_units_df = load_data_for_diagram(DATABASE_PATH)
+    power_plants_df = load_data_table(DATABASE_PATH, 'power_plants')
 
     solar_capacity = power_plants_df.loc[power_plants_df['type'] == 'Solar', 'capacity_mw'].sum()
     wind_capacity = power_plants_df.loc[power_plants_df['type'] == 'Wind', 'capacity_mw'].sum()
@@ -345,48 +866,177 @@ def calc_aggregate_capacities(DATABASE_PATH):
 
 
 # Function to Run Optimization and Capture Output
-def run_optimization(network):
+# Rolling-horizon optimization: the snapshots are solved in windows of ROLLING_HORIZON snapshots, each overlapping
+# the next by ROLLING_OVERLAP, so only one window's model is in memory at a time.  0 solves all snapshots at once.
+ROLLING_HORIZON = int(os.environ.get('CLEANPOWERSIM_ROLLING_HORIZON', 0))
+ROLLING_OVERLAP = int(os.environ.get('CLEANPOWERSIM_ROLLING_OVERLAP', 0))
+
+def get_window_log_path(log_fn, window):
+    # Each rolling-horizon window's solver writes its own log next to 'log_fn', so the log of the window being
+    # solved can be followed without the end of the previous window's log (see optimization_jobs)
+    root, extension = os.path.splitext(log_fn)
+    return f"{root}.window{window}{extension}"
+
+def get_solver_log_paths(log_fn):
+    # The solver logs of a run: 'log_fn' itself and those of its rolling-horizon windows
+    return [log_fn] + glob.glob(get_window_log_path(glob.escape(log_fn), '*'))
+
+def optimize_rolling_horizon(network, horizon, overlap=0, solver_name=None, solver_settings=None, log_fn=None):
+    # Optimizes the network in consecutive windows of 'horizon' snapshots, each starting 'overlap' snapshots before
+    # the previous one ended.  The overlap is re-solved by the next window (it only serves as look-ahead), and
+    # storage starts each window with the state of charge reached just before it.  The results are written into
+    # the network's time series as usual.  Returns the solver info and a list of per-window statistics.
+    snapshots = network.snapshots
+    if overlap >= horizon:
+        raise ValueError("The rolling-horizon overlap must be shorter than the horizon")
+
+    starts = [0]
+    while starts[-1] + horizon < len(snapshots):
+        starts.append(starts[-1] + horizon - overlap)
+
+    solver_info = None
+    windows = []
+    for i, start in enumerate(starts):
+        window = snapshots[start:start + horizon]
+        if i > 0 and not network.storage_units.empty:
+            network.storage_units['state_of_charge_initial'] = network.storage_units_t.state_of_charge.loc[snapshots[start - 1]]
+
+        logger.info("Optimizing window %d/%d (%s to %s)", i + 1, len(starts), window[0], window[-1])
+        with track_peak_memory() as memory:
+            info = solve_network(network, solver_name, solver_settings, log_fn=get_window_log_path(log_fn, i + 1) if log_fn else None, snapshots=window)
+
+        windows.append({
+            'start': str(window[0]),
+            'end': str(window[-1]),
+            'solver': info['name'],
+            'solve_time': info['solve_time'],
+            'peak_memory_mb': memory['peak_mb']
+        })
+        peak_memory = f"{memory['peak_mb']:.0f} MB" if memory['peak_mb'] is not None else "unknown"
+        logger.info("Window %d/%d solved in %.2f s, peak memory %s", i + 1, len(starts), info['solve_time'], peak_memory)
+
+        # Later windows use whichever solver worked, rather than retrying ones that failed
+        if solver_info is None:
+            solver_info = dict(info)
+            solver_name = info['name']
+        else:
+            solver_info['solve_time'] += info['solve_time']
+
+    return solver_info, windows
+
+def run_optimization(network, log_path=None, solver_log_path=None, solver_name=None, solver_settings=None, horizon=None, overlap=None, result_format='compact'):
+    # Returns the results in the compact layout, or with result_format='dict' in the {component: {snapshot: value}}
+    # layout of earlier versions (see result_format)
 
     # Load network data and create PyPSA network object
     # power_plants_df, storage_units_df, buses_df, lines_df, demand_df, snapshots_df, wind_profile_df, solar_profile_df  = load_data(DATABASE_PATH)
     # network = create_network(power_plants_df, storage_units_df, buses_df, lines_df, demand_df, snapshots_df, wind_profile_df, solar_profile_df)
 
     # Set up logging 
-    logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
 
-    try:
-        logger.info("Starting network optimization...")
+    # Messages from this module, PyPSA and linopy go to 'log_path' and the solver writes its own log to
+    # 'solver_log_path', so a job's progress can be followed while it runs (see optimization_jobs)
+    log_handler = None
+    if log_path:
+        log_handler = logging.FileHandler(log_path)
+        log_handler.setFormatter(logging.Formatter('%(asctime)s %(name)s: %(message)s', '%H:%M:%S'))
+        for name in (__name__, 'solvers', 'pypsa', 'linopy'):
+            logging.getLogger(name).addHandler(log_handler)
+            if logging.getLogger(name).getEffectiveLevel() > logging.INFO:
+                logging.getLogger(name).setLevel(logging.INFO)
 
+    # Times this run's stages (model build, solve, result extraction; see instrumentation)
+    with record_stages() as stages:
         try:
-            network.optimize(solver_name='cplex')
-            logger.info("Optimization complete!")
-            optimization_successful = True
-        except Exception as opt_error:  # Catch solver errors
-            logger.exception("Error during optimization: %s", opt_error)
-            logger.debug("CPLEX log: %s", network.opt.get_log())  # Log CPLEX solver's internal log!
-            optimization_successful = False  # Mark optimization as unsuccessful
-            raise  # Re-raise the error for the main thread to handle
-
-        # Process results if optimization was successful
-        if optimization_successful:
-
-            # Convert the snapshots to a list of strings for JSON serialization
-            snapshots_list = [str(snapshot) for snapshot in network.snapshots]
-
-            # Store the optimization results as a dictionary
-            optimization_results_dict = {
-                "snapshots": snapshots_list,
-                "generators_t_p": {
-                    "data": network.generators_t.p.rename(index=str).to_dict(),
-                    "types": network.generators["type"].to_dict()  # Add generator types from the network object
-                },
-                "storage_units_t_p": network.storage_units_t.p.rename(index=str).to_dict(),
-                "buses_t_marginal_price": network.buses_t.marginal_price.rename(index=str).to_dict()
-            }
-
-            return optimization_results_dict
-
-    except Exception as e:
-        logger.exception("An unexpected error occurred: %s", e)
-        return None
+            logger.info("Starting network optimization...")
+
+            try:
+                # Uses the fastest installed solver unless one is given, falling back to the next if it fails to run.
+                # Without a rolling horizon the whole period is a single window.
+                horizon = horizon or ROLLING_HORIZON
+                overlap = (ROLLING_OVERLAP if overlap is None else overlap) if horizon else 0
+                network_size = {component: len(getattr(network, component)) for component in ('snapshots', 'buses', 'generators', 'storage_units', 'lines')}
+
+                # An identical run (same network inputs, solvers and options) returns its stored results
+                cache_key = None
+                if RESULT_CACHE_MB:
+                    solvers = [solver_name] if solver_name else get_available_solvers()
+                    cache_key = fingerprint_network(network, solvers={solver: get_solver_options(solver, solver_settings) for solver in solvers},
+                                                    horizon=horizon, overlap=overlap, result_format=result_format)
+                    cached_results = get_cached_result(cache_key)
+                    if cached_results is not None:
+                        logger.info("Returning cached results of an identical run (%s)", cache_key[:12])
+                        cached_results = {**cached_results, "cached": True, "instrumentation": get_run_instrumentation(stages, network_size)}
+                        return results_to_dict(cached_results) if result_format == 'dict' else cached_results
+
+                if REUSE_MODEL and not horizon:
+                    # What-if runs that only change capacities or costs update and re-solve this process's last model
+                    with track_peak_memory() as memory:
+                        state = get_model(network)
+                        solver_info = solve_model(state, solver_name, solver_settings, log_fn=solver_log_path)
+                    network = state['network']
+                    windows = [{
+                        'start': str(network.snapshots[0]),
+                        'end': str(network.snapshots[-1]),
+                        'solver': solver_info['name'],
+                        'solve_time': solver_info['solve_time'],
+                        'peak_memory_mb': memory['peak_mb']
+                    }]
+                else:
+                    solver_info, windows = optimize_rolling_horizon(network, horizon or len(network.snapshots), overlap, solver_name, solver_settings, log_fn=solver_log_path)
+                logger.info("Optimization complete!")
+                optimization_successful = True
+            except Exception as opt_error:  # Catch solver errors
+                logger.exception("Error during optimization: %s", opt_error)
+                solver_logs = [path for path in get_solver_log_paths(solver_log_path) if os.path.exists(path)] if solver_log_path else []
+                if solver_logs:
+                    with open(max(solver_logs, key=os.path.getmtime), errors='replace') as f:
+                        logger.debug("Solver log: %s", f.read()[-5000:])  # Log the end of the last solver log written
+                optimization_successful = False  # Mark optimization as unsuccessful
+                raise  # Re-raise the error for the main thread to handle
+
+            # Process results if optimization was successful
+            if optimization_successful:
+
+                with track_stage('result extraction'):
+                    # Store the optimization results in the compact layout: the snapshots once, and each time
+                    # series as a float32 matrix with its component names (see result_format).  Results returned in
+                    # the dict layout keep the solver's float64 values.
+                    optimization_results_dict = compact_results(
+                        network.snapshots,
+                        {
+                            "generators_t_p": network.generators_t.p,
+                            "storage_units_t_p": network.storage_units_t.p,
+                            "buses_t_marginal_price": network.buses_t.marginal_price
+                        },
+                        network.generators["type"],  # Add generator types from the network object
+                        dtype=np.float64 if result_format == 'dict' else RESULT_DTYPE,
+                        solver=solver_info,  # Which solver ran, with which options, and how long it took
+                        windows=windows  # Solve time and peak memory of each rolling-horizon window
+                    )
+
+                    # Results of a reduced network are split back over the original buses and components, and
+                    # those of an aggregated network spread back over the full calendar
+                    if 'reduction' in network.meta:
+                        optimization_results_dict = disaggregate_results(optimization_results_dict, network.meta['reduction'])
+                    if 'calendar' in network.meta:
+                        optimization_results_dict = expand_to_calendar(optimization_results_dict, network.meta['calendar'])
+
+                if cache_key:
+                    store_result(cache_key, optimization_results_dict)
+
+                # Stage timings and LP size are kept with the results, but not in the cache
+                optimization_results_dict = {**optimization_results_dict, "instrumentation": get_run_instrumentation(stages, network_size)}
+                return results_to_dict(optimization_results_dict) if result_format == 'dict' else optimization_results_dict
+
+        except Exception as e:
+            logger.exception("An unexpected error occurred: %s", e)
+            return None
+
+        finally:
+            # Worker processes are reused between jobs, so detach this job's log file
+            if log_handler is not None:
+                for name in (__name__, 'solvers', 'pypsa', 'linopy'):
+                    logging.getLogger(name).removeHandler(log_handler)
+                log_handler.close()
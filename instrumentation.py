@@ -0,0 +1,132 @@
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from importlib import metadata
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; without it peak memory is the process's lifetime maximum where the OS reports one
+    psutil = None
+
+# Each optimization run appends one JSON record of its stage timings, memory and LP size here ('' turns it off)
+METRICS_PATH = os.environ.get('CLEANPOWERSIM_METRICS_PATH', os.path.join(tempfile.gettempdir(), 'cleanpowersim_metrics.jsonl'))
+
+# Packages whose versions are recorded with each run, to tell regressions from upgrades
+RECORDED_PACKAGES = ['pypsa', 'linopy', 'highspy', 'pandas', 'numpy']
+
+# The stages being recorded in this thread, if any (see record_stages)
+active_stages = threading.local()
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10  # Bytes on macOS, KiB elsewhere
+
+@contextmanager
+def track_peak_memory(interval=0.05):
+    # Yields a dict whose 'peak_mb' is set, on leaving the block, to the most resident memory the process used
+    # while it ran (sampled every 'interval' seconds)
+    stats = {'peak_mb': None}
+    if psutil is None:
+        yield stats
+        stats['peak_mb'] = _max_rss_mb()
+        return
+
+    process = psutil.Process()
+    peak = [process.memory_info().rss]
+    finished = threading.Event()
+
+    def sample():
+        while not finished.wait(interval):
+            peak[0] = max(peak[0], process.memory_info().rss)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield stats
+    finally:
+        finished.set()
+        sampler.join()
+        stats['peak_mb'] = max(peak[0], process.memory_info().rss) / 2**20
+
+@contextmanager
+def record_stages():
+    # Collects the stages timed with track_stage in this thread while the block runs, and yields them as a list
+    previous = getattr(active_stages, 'stages', None)
+    active_stages.stages = stages = []
+    try:
+        yield stages
+    finally:
+        active_stages.stages = previous
+
+@contextmanager
+def track_stage(name, **details):
+    # Times a pipeline stage: its wall time, CPU time (of the whole process, so solver threads count) and peak
+    # resident memory.  The stage is added to the stages being recorded, if any, and otherwise costs nothing.
+    # Yields the stage's record, to which the block can add details (such as the LP size).
+    stages = getattr(active_stages, 'stages', None)
+    stage = {'stage': name, **details}
+    if stages is None:
+        yield stage
+        return
+
+    wall_time, cpu_time = time.perf_counter(), time.process_time()
+    with track_peak_memory() as memory:
+        yield stage
+    stage.update(wall_time=time.perf_counter() - wall_time, cpu_time=time.process_time() - cpu_time, peak_rss_mb=memory['peak_mb'])
+    stages.append(stage)
+
+def get_lp_size(model):
+    # Variables, constraints and nonzeros of a linopy model
+    nonzeros = sum(int(((constraint.vars >= 0) & (constraint.labels >= 0)).sum()) for constraint in model.constraints.data.values())
+    return {'variables': int(model.nvars), 'constraints': int(model.ncons), 'nonzeros': nonzeros}
+
+def get_versions():
+    versions = {'python': platform.python_version()}
+    for package in RECORDED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    return versions
+
+def summarize_stages(stages):
+    # Totals by stage name, in order of first appearance (a rolling-horizon run builds and solves once per window)
+    totals = {}
+    for stage in stages:
+        total = totals.setdefault(stage['stage'], {'stage': stage['stage'], 'count': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss_mb': None})
+        total['count'] += 1
+        total['wall_time'] += stage['wall_time']
+        total['cpu_time'] += stage['cpu_time']
+        if stage['peak_rss_mb'] is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, stage['peak_rss_mb'])
+    return list(totals.values())
+
+def get_run_instrumentation(stages, network_size):
+    # What a run records about itself: its stages, the size of the largest LP it solved, the size of the network
+    # and the package versions
+    models = [stage for stage in stages if 'variables' in stage]
+    largest = max(models, key=lambda stage: stage['variables'], default=None)
+    return {
+        'stages': stages,
+        'lp': {key: largest[key] for key in ('variables', 'constraints', 'nonzeros')} if largest else None,
+        'network': network_size,
+        'versions': get_versions()
+    }
+
+def write_run_record(record, path=None):
+    # Appends a run's record as one line of JSON to 'path' (default METRICS_PATH)
+    path = METRICS_PATH if path is None else path
+    if not path:
+        return
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
@@ -22,7 +22,7 @@ def check_nodal_capacity_vs_demand(network):
 
     # Calculate nodal generation capacity
     generator_capacities = network.generators_t.p_max_pu * network.generators.p_nom
-    nodal_generation_capacity = generator_capacities.groupby(network.generators.bus, axis=1).sum()
+    nodal_generation_capacity = generator_capacities.T.groupby(network.generators.bus).sum().T
 
     # Calculate transmission capacity into each node
     transmission_capacity = pd.DataFrame(0, index=network.snapshots, columns=network.buses.index)
@@ -0,0 +1,144 @@
+import atexit
+import hashlib
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from linopy import LinearExpression
+
+from instrumentation import track_stage, get_lp_size
+from solvers import solve_network
+
+logger = logging.getLogger(__name__)
+
+# Keep the last optimization model built in each process and reuse it when the next network differs only in its
+# generators' p_nom, marginal_cost or availability.  Off by default, as a full-year model holds a lot of memory.
+REUSE_MODEL = os.environ.get('CLEANPOWERSIM_REUSE_MODEL', '0') == '1'
+
+# The model currently held by this process: {'key', 'network', 'basis_fn', 'solves'}
+model_cache = {}
+
+# Whether forget_model runs when this process exits (set up by the first model built), so job and sweep workers,
+# which exit without calling it, don't leave their basis files behind
+forget_at_exit = False
+
+# Inputs that change the shape or constraints of the model, other than those update_model can change in place
+STRUCTURE_COLUMNS = {
+    'buses': ['v_nom'],
+    'generators': ['bus', 'type', 'p_nom_extendable', 'e_sum_min', 'e_sum_max'],
+    'storage_units': ['bus', 'p_nom', 'max_hours', 'efficiency_store', 'efficiency_dispatch', 'marginal_cost',
+                      'cyclic_state_of_charge', 'state_of_charge_initial'],
+    'lines': ['bus0', 'bus1', 's_nom', 'x', 'r'],
+    'loads': ['bus', 'p_set']
+}
+
+
+def get_structure_key(network):
+    # Fingerprint of everything in 'network' that the model depends on, except generator p_nom, marginal_cost
+    # and p_max_pu / p_min_pu, which update_model can change in an existing model
+    digest = hashlib.sha1()
+    for component, columns in STRUCTURE_COLUMNS.items():
+        df = getattr(network, component)
+        digest.update(pd.util.hash_pandas_object(df[[column for column in columns if column in df.columns]].reset_index(), index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(network.snapshot_weightings.reset_index(), index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(network.loads_t.p_set.reset_index(), index=False).to_numpy().tobytes())
+    digest.update(','.join(network.loads_t.p_set.columns).encode())
+    return digest.hexdigest()
+
+def build_model(network):
+    # Builds the optimization model of 'network' once, to be updated and solved repeatedly
+    global forget_at_exit
+    if not forget_at_exit:
+        atexit.register(forget_model)
+        forget_at_exit = True
+
+    start_time = time.perf_counter()
+    with track_stage('model build') as stage:
+        network.optimize.create_model()
+        stage.update(get_lp_size(network.model))
+    state = {
+        'key': get_structure_key(network),
+        'network': network,
+        'basis_fn': os.path.join(tempfile.gettempdir(), f'cleanpowersim_basis_{os.getpid()}_{uuid.uuid4().hex}.bas'),
+        'solves': 0
+    }
+    logger.info("Optimization model built in %.2f s", time.perf_counter() - start_time)
+    return state
+
+def update_model(state, network):
+    # Copies the generators' p_nom, marginal_cost and availability from 'network' into the model's network, and
+    # changes only the matching constraint right-hand sides and objective coefficients of the built model
+    model_network = state['network']
+    model = model_network.model
+    if network is not model_network:
+        model_network.generators['p_nom'] = network.generators['p_nom']
+        model_network.generators['marginal_cost'] = network.generators['marginal_cost']
+        model_network.generators['p_max_pu'] = network.generators['p_max_pu']
+        model_network.generators['p_min_pu'] = network.generators['p_min_pu']
+        model_network.generators_t.p_max_pu = network.generators_t.p_max_pu
+        model_network.generators_t.p_min_pu = network.generators_t.p_min_pu
+        model_network.meta.clear()
+        model_network.meta.update(network.meta)
+
+    # Fixed-capacity generators are limited by p_min_pu * p_nom <= p <= p_max_pu * p_nom
+    for constraint_name, attribute in [('Generator-fix-p-upper', 'p_max_pu'), ('Generator-fix-p-lower', 'p_min_pu')]:
+        if constraint_name not in model.constraints:
+            continue
+        constraint = model.constraints[constraint_name]
+        snapshots, names = constraint.rhs.indexes['snapshot'], constraint.rhs.indexes['name']
+        per_unit = model_network.get_switchable_as_dense('Generator', attribute).loc[snapshots, names]
+        constraint.rhs = constraint.rhs.copy(data=(per_unit * model_network.generators.loc[names, 'p_nom']).to_numpy())
+
+    # Objective coefficients of the generator dispatch: snapshot weighting x marginal cost
+    variable = model.variables['Generator-p']
+    snapshots, names = variable.labels.indexes['snapshot'], variable.labels.indexes['name']
+    marginal_cost = model_network.get_switchable_as_dense('Generator', 'marginal_cost').loc[snapshots, names]
+    coefficients = (marginal_cost.mul(model_network.snapshot_weightings.loc[snapshots, 'objective'], axis=0)).to_numpy()
+
+    labels = variable.labels.to_numpy()
+    lookup = np.full(model._xCounter, np.nan)
+    lookup[labels[labels >= 0]] = coefficients[labels >= 0]
+    expression = model.objective.expression
+    terms, coeffs = expression.vars.to_numpy(), expression.coeffs.to_numpy().copy()
+    updated = (terms >= 0) & ~np.isnan(lookup[np.where(terms >= 0, terms, 0)])
+    if np.array_equal(coeffs[updated], lookup[terms[updated]]):
+        return
+    coeffs[updated] = lookup[terms[updated]]
+    model.objective = LinearExpression(expression.data.assign(coeffs=(expression.coeffs.dims, coeffs)), model)
+
+    # The previous basis stays a good start after capacity changes (it remains dual feasible), but after cost
+    # changes the solver does better presolving and starting afresh
+    if os.path.exists(state['basis_fn']):
+        os.remove(state['basis_fn'])
+
+def get_model(network):
+    # Returns this process's model for 'network', updated to its capacities and costs, or a newly built one if the
+    # network differs in anything else
+    key = get_structure_key(network)
+    if model_cache.get('key') == key:
+        with track_stage('model update') as stage:
+            update_model(model_cache, network)
+            stage.update(get_lp_size(model_cache['network'].model))
+        logger.info("Reusing the optimization model (%d previous solves)", model_cache['solves'])
+        return model_cache
+
+    forget_model()
+    model_cache.update(build_model(network))
+    return model_cache
+
+def solve_model(state, solver_name=None, solver_settings=None, log_fn=None):
+    # Solves the (updated) model, warm starting from the previous solve's basis where the solver supports it
+    solver_info = solve_network(state['network'], solver_name, solver_settings, log_fn=log_fn, reuse_model=True, basis_fn=state['basis_fn'])
+    state['network'].model.solver_model = None  # The solver's own copy of the problem isn't reused, so free it
+    state['solves'] += 1
+    return solver_info
+
+def forget_model():
+    # Releases the model held by this process
+    if model_cache.get('basis_fn') and os.path.exists(model_cache['basis_fn']):
+        os.remove(model_cache['basis_fn'])
+    model_cache.clear()
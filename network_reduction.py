@@ -0,0 +1,171 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pypsa
+
+from time_aggregation import kmeans
+
+logger = logging.getLogger(__name__)
+
+# Number of zones to cluster the buses into before optimizing (0 keeps every bus)
+NETWORK_ZONES = int(os.environ.get('CLEANPOWERSIM_NETWORK_ZONES', 0))
+
+
+def cluster_buses(network, n_zones, seed=0):
+    # Assigns each bus to one of 'n_zones' zones (returned as a Series of zone names by bus).  Buses are clustered
+    # on their location and on their electrical distance: a spectral embedding of the line network weighted by
+    # susceptance (1/x), so buses joined by strong lines end up close together.
+    buses = network.buses.index
+    n_zones = min(n_zones, len(buses))
+    location_columns = ['longitude', 'latitude'] if {'longitude', 'latitude'} <= set(network.buses.columns) else ['x', 'y']
+    location = network.buses[location_columns].fillna(0).to_numpy(dtype=float)
+    location = (location - location.mean(axis=0)) / np.where(location.std(axis=0) > 0, location.std(axis=0), 1)
+    blocks = [location / np.sqrt(location.shape[1])]
+
+    lines = network.lines[network.lines['bus0'].isin(buses) & network.lines['bus1'].isin(buses)]
+    if not lines.empty and n_zones > 1:
+        positions = pd.Series(np.arange(len(buses)), index=buses)
+        i, j = positions[lines['bus0']].to_numpy(), positions[lines['bus1']].to_numpy()
+        susceptance = 1 / np.maximum(lines['x'].abs().to_numpy(dtype=float), 1e-9)
+        adjacency = np.zeros((len(buses), len(buses)))
+        np.add.at(adjacency, (i, j), susceptance)
+        np.add.at(adjacency, (j, i), susceptance)
+
+        # Eigenvectors of the normalized Laplacian with the smallest eigenvalues, leaving out the trivial first one
+        degree = adjacency.sum(axis=1)
+        scale = 1 / np.sqrt(np.where(degree > 0, degree, 1))
+        laplacian = np.eye(len(buses)) - scale[:, None] * adjacency * scale[None, :]
+        _, vectors = np.linalg.eigh(laplacian)
+        embedding = vectors[:, 1:n_zones]
+        embedding = embedding / np.where(embedding.std(axis=0) > 0, embedding.std(axis=0), 1)
+        blocks.append(embedding / np.sqrt(embedding.shape[1]))
+
+    labels = kmeans(np.hstack(blocks), n_zones, np.random.default_rng(seed))
+    labels = np.unique(labels, return_inverse=True)[1]
+    return pd.Series([f"Zone_{label + 1}" for label in labels], index=buses, name='zone')
+
+def _merge_groups(static, keys, time_varying=None):
+    # Groups components that can be merged without changing the optimum: same zone, the same 'keys' attributes
+    # and the same time-varying limit, if any.  Returns each component's group number.
+    profiles = 0 if time_varying is None else pd.factorize(pd.Series([time_varying[name].to_numpy().tobytes() for name in static.index]))[0]
+    return static.assign(profile=profiles).groupby(['zone'] + keys + ['profile'], sort=False, dropna=False).ngroup()
+
+def reduce_network(network, n_zones, seed=0):
+    # Builds a network in which the buses are clustered into 'n_zones' zones (see cluster_buses).  Within a zone,
+    # generators and storage units with identical costs, efficiencies and availability are merged into one, loads
+    # are summed, and lines between zones are replaced by one equivalent line per pair of zones (capacities
+    # added, impedances in parallel).  Lines inside a zone are dropped.  How to split the results back over the
+    # original components travels with the network, so run_optimization returns results for the original buses.
+    start_time = time.perf_counter()
+    bus_zones = cluster_buses(network, n_zones, seed)
+
+    reduced = pypsa.Network()
+    reduced.set_snapshots(network.snapshots)
+    for column in network.snapshot_weightings.columns:
+        reduced.snapshot_weightings[column] = network.snapshot_weightings[column].to_numpy()
+    reduced.meta.update(network.meta)
+
+    # Zone buses, placed at the mean position of their buses
+    buses = network.buses.assign(zone=bus_zones)
+    location_columns = [column for column in ['longitude', 'latitude'] if column in buses.columns]
+    zones = buses.groupby('zone').agg(v_nom=('v_nom', 'max'), **{column: (column, 'mean') for column in location_columns})
+    reduced.add("Bus", zones.index.values, v_nom=zones['v_nom'].values, carrier="AC",
+                **{column: zones[column].values for column in location_columns})
+
+    # Generators: p_nom and energy limits add up, shares of the merged p_nom split the dispatch back
+    generators = network.generators.assign(zone=network.generators['bus'].map(bus_zones))
+    p_max_pu = network.generators_t.p_max_pu.reindex(columns=generators.index).fillna(generators['p_max_pu'])
+    groups = _merge_groups(generators, ['type', 'marginal_cost'], p_max_pu)
+    merged = generators.groupby(groups).agg(zone=('zone', 'first'), type=('type', 'first'), marginal_cost=('marginal_cost', 'first'),
+                                            p_nom=('p_nom', 'sum'), e_sum_max=('e_sum_max', 'sum'), representative=('zone', lambda zone: zone.index[0]))
+    merged.index = [f"{zone}_{kind}_{group}" for group, zone, kind in zip(merged.index, merged['zone'], merged['type'])]
+    if not merged.empty:
+        reduced.add(
+            "Generator",
+            merged.index.values,
+            bus=merged['zone'].values,
+            p_nom=merged['p_nom'].values,
+            p_max_pu=p_max_pu[merged['representative']].set_axis(merged.index, axis=1),
+            marginal_cost=merged['marginal_cost'].values,
+            type=merged['type'].values,
+            e_sum_max=merged['e_sum_max'].values
+        )
+    generator_shares = generators['p_nom'] / generators.groupby(groups)['p_nom'].transform('sum').replace(0, np.nan)
+    generator_shares = generator_shares.fillna(1 / generators.groupby(groups)['p_nom'].transform('size'))
+
+    # Storage units merge the same way, keeping their hours of storage
+    storage_units = network.storage_units.assign(zone=network.storage_units['bus'].map(bus_zones))
+    storage_groups = _merge_groups(storage_units, ['max_hours', 'efficiency_store', 'efficiency_dispatch', 'marginal_cost', 'cyclic_state_of_charge'])
+    merged_storage = storage_units.groupby(storage_groups).agg(
+        zone=('zone', 'first'), p_nom=('p_nom', 'sum'), state_of_charge_initial=('state_of_charge_initial', 'sum'),
+        max_hours=('max_hours', 'first'), efficiency_store=('efficiency_store', 'first'), efficiency_dispatch=('efficiency_dispatch', 'first'),
+        marginal_cost=('marginal_cost', 'first'), cyclic_state_of_charge=('cyclic_state_of_charge', 'first'))
+    merged_storage.index = [f"{zone}_Storage_{group}" for group, zone in zip(merged_storage.index, merged_storage['zone'])]
+    if not merged_storage.empty:
+        reduced.add("StorageUnit", merged_storage.index.values, bus=merged_storage['zone'].values,
+                    **{column: merged_storage[column].values for column in merged_storage.columns if column != 'zone'})
+    storage_shares = storage_units['p_nom'] / storage_units.groupby(storage_groups)['p_nom'].transform('sum').replace(0, np.nan)
+    storage_shares = storage_shares.fillna(1 / storage_units.groupby(storage_groups)['p_nom'].transform('size'))
+
+    # One load per zone with the summed demand of its buses
+    loads = network.loads
+    if not loads.empty:
+        p_set = network.loads_t.p_set.reindex(columns=loads.index).fillna(loads['p_set'])
+        zone_demand = p_set.T.groupby(loads['bus'].map(bus_zones).values).sum().T
+        reduced.add("Load", [f"Load_{zone}" for zone in zone_demand.columns], bus=zone_demand.columns.values,
+                    p_set=zone_demand.set_axis([f"Load_{zone}" for zone in zone_demand.columns], axis=1))
+
+    # Equivalent lines between zones: capacities add up, impedances combine in parallel
+    lines = network.lines.assign(zone0=network.lines['bus0'].map(bus_zones), zone1=network.lines['bus1'].map(bus_zones))
+    lines = lines[lines['zone0'] != lines['zone1']]
+    if not lines.empty:
+        pairs = pd.DataFrame({'zone0': np.minimum(lines['zone0'], lines['zone1']), 'zone1': np.maximum(lines['zone0'], lines['zone1'])}, index=lines.index)
+        equivalent = lines.assign(**pairs, susceptance=1 / np.maximum(lines['x'].abs(), 1e-9), conductance=1 / np.maximum(lines['r'].abs(), 1e-9)).groupby(
+            ['zone0', 'zone1']).agg(s_nom=('s_nom', 'sum'), susceptance=('susceptance', 'sum'), conductance=('conductance', 'sum'), length=('length', 'mean'))
+        reduced.add(
+            "Line",
+            [f"{zone0}_{zone1}" for zone0, zone1 in equivalent.index],
+            bus0=equivalent.index.get_level_values('zone0').values,
+            bus1=equivalent.index.get_level_values('zone1').values,
+            s_nom=equivalent['s_nom'].values,
+            x=1 / equivalent['susceptance'].values,
+            r=1 / equivalent['conductance'].values,
+            length=equivalent['length'].values
+        )
+
+    # How to map the reduced network's results back onto the original components
+    reduced.meta['reduction'] = {
+        'buses': bus_zones.to_dict(),
+        'generators': {name: [merged.index[group], share] for name, group, share in zip(generators.index, groups, generator_shares)},
+        'generator_types': network.generators['type'].to_dict(),
+        'storage_units': {name: [merged_storage.index[group], share] for name, group, share in zip(storage_units.index, storage_groups, storage_shares)}
+    }
+
+    logger.info("Reduced network from %d buses, %d generators and %d lines to %d zones, %d generators and %d lines in %.2f s",
+                len(network.buses), len(network.generators), len(network.lines),
+                len(reduced.buses), len(reduced.generators), len(reduced.lines), time.perf_counter() - start_time)
+    return reduced
+
+def disaggregate_results(optimization_results, reduction):
+    # Splits compact results of a reduced network (see result_format) back over the original components: merged
+    # generators and storage units by their share of p_nom, and each original bus gets its zone's marginal price
+    def split(entry, mapping):
+        names = list(mapping)
+        positions = {name: i for i, name in enumerate(entry['names'])}
+        columns = np.array([positions.get(mapping[name][0], -1) for name in names], dtype=int)
+        shares = np.array([mapping[name][1] for name in names], dtype=entry['values'].dtype)
+        values = entry['values'][:, np.maximum(columns, 0)] * shares
+        values[:, columns < 0] = np.nan
+        return {'names': names, 'values': values}
+
+    disaggregated = dict(optimization_results)
+    disaggregated['generators_t_p'] = {
+        **split(optimization_results['generators_t_p'], reduction['generators']),
+        'types': [reduction['generator_types'][name] for name in reduction['generators']]
+    }
+    disaggregated['storage_units_t_p'] = split(optimization_results['storage_units_t_p'], reduction['storage_units'])
+    disaggregated['buses_t_marginal_price'] = split(optimization_results['buses_t_marginal_price'], {bus: [zone, 1] for bus, zone in reduction['buses'].items()})
+    return disaggregated
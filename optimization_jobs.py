@@ -0,0 +1,245 @@
+import logging
+import math
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from external_functions import run_optimization, get_window_log_path, get_solver_log_paths
+
+logger = logging.getLogger(__name__)
+
+# Number of optimizations that can run at once; further runs wait in the pool's queue
+OPTIMIZATION_WORKERS = int(os.environ.get('CLEANPOWERSIM_OPTIMIZATION_WORKERS', 2))
+
+# Each job's log (model building) and solver log are written here by the worker and read back while it runs
+LOG_DIR = os.path.join(tempfile.gettempdir(), 'cleanpowersim_jobs')
+
+# Finished jobs whose results were never collected, and their logs, are dropped this long after they finished
+# (checked whenever a job is submitted)
+JOB_KEEP_SECONDS = int(os.environ.get('CLEANPOWERSIM_JOB_KEEP_SECONDS', 24 * 3600))
+
+# Submitted jobs by id: {'future', 'submitted', 'started', 'finished', 'log_paths', 'log_offsets', 'partial_line',
+# 'solver', 'window', 'progress', 'preparation_stages'}
+jobs = {}
+jobs_lock = threading.Lock()
+executor = None
+
+
+def get_executor():
+    # Worker processes are started on first use.  'spawn' gives each a clean interpreter rather than a fork of
+    # the (multi-threaded) web server.
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=OPTIMIZATION_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return executor
+
+def submit_optimization(network, preparation_stages=None, **optimization_options):
+    # Queues an optimization of 'network' in a worker process and returns its job id straight away.  The options
+    # (solver_name, solver_settings, horizon, overlap) are passed on to run_optimization.  'preparation_stages'
+    # are the timed stages that built the network (see instrumentation), kept with the job.
+    prune_jobs()
+    job_id = uuid.uuid4().hex
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_paths = (os.path.join(LOG_DIR, f'{job_id}.log'), os.path.join(LOG_DIR, f'{job_id}.solver.log'))
+    with jobs_lock:
+        job = jobs[job_id] = {
+            'future': get_executor().submit(run_optimization, network, *log_paths, **optimization_options),
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'log_paths': log_paths,
+            'log_offsets': [0, 0],
+            'partial_line': '',
+            'solver': {'started': False, 'iterations': None, 'objective': None, 'gap': None},
+            'window': None,
+            'progress': 0,
+            'preparation_stages': preparation_stages or []
+        }
+        job['future'].add_done_callback(lambda future: job.update(finished=time.time()))
+    logger.info("Submitted optimization job %s", job_id)
+    return job_id
+
+def get_job_status(job_id):
+    # Returns {'status': 'queued' | 'running' | 'done' | 'failed' | 'unknown', 'elapsed', 'result', 'error'}, and
+    # for finished jobs the 'preparation_stages' they were submitted with
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        return {'status': 'unknown', 'elapsed': 0, 'result': None, 'error': "No such job"}
+
+    future = job['future']
+    if future.running() and job['started'] is None:
+        job['started'] = time.time()
+    elapsed = time.time() - (job['started'] or job['submitted'])
+
+    if not future.done():
+        return {'status': 'running' if future.running() else 'queued', 'elapsed': elapsed, 'result': None, 'error': None}
+
+    try:
+        result = future.result()
+    except Exception as e:  # The worker process raised or died
+        return {'status': 'failed', 'elapsed': elapsed, 'result': None, 'error': str(e)}
+
+    if result is None:
+        return {'status': 'failed', 'elapsed': elapsed, 'result': None, 'error': "Optimization model has failed."}
+    return {'status': 'done', 'elapsed': elapsed, 'result': result, 'error': None, 'preparation_stages': job['preparation_stages']}
+
+def forget_job(job_id):
+    # Drops a finished job (and its results and logs) once they have been collected
+    with jobs_lock:
+        job = jobs.pop(job_id, None)
+    if job is not None:
+        _remove_job_logs(job)
+
+def prune_jobs():
+    # Drops the jobs that finished more than JOB_KEEP_SECONDS ago without being collected, and the logs left in
+    # LOG_DIR by jobs this process no longer knows about (e.g. those of a previous run of the app)
+    cutoff = time.time() - JOB_KEEP_SECONDS
+    with jobs_lock:
+        expired = [job_id for job_id, job in jobs.items() if job['finished'] is not None and job['finished'] < cutoff]
+        expired_jobs = [jobs.pop(job_id) for job_id in expired]
+        known_ids = set(jobs)
+    for job in expired_jobs:
+        _remove_job_logs(job)
+
+    if os.path.isdir(LOG_DIR):
+        for entry in os.scandir(LOG_DIR):
+            if entry.name.split('.')[0] in known_ids:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:  # Removed by another process meanwhile
+                pass
+    if expired_jobs:
+        logger.info("Pruned %d finished optimization jobs", len(expired_jobs))
+
+def _remove_job_logs(job):
+    for path in [job['log_paths'][0]] + get_solver_log_paths(job['log_paths'][1]):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Solver log lines that carry progress.  HiGHS simplex prints "iteration objective Pr: ..." rows, HiGHS IPX and
+# CPLEX barrier print "iteration primal-objective dual-objective ..." rows, and CPLEX simplex prints
+# "Iteration: n  ... objective = x".  Gaps are read from MIP progress lines and the final summaries.
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+SIMPLEX_ROW = re.compile(rf'^\s*(\d+)\s+({NUMBER})\s+(?:Pr|Du|Ph1)\b')
+BARRIER_ROW = re.compile(rf'^\s*(\d+)\s+({NUMBER})\s+({NUMBER})\s+{NUMBER}\s+{NUMBER}')
+CPLEX_ITERATION = re.compile(rf'Iteration:\s+(\d+).*?[Oo]bjective\s*=\s*({NUMBER})')
+OBJECTIVE = re.compile(rf'[Oo]bjective(?: value)?\s*[:=]\s*({NUMBER})')
+ITERATIONS = re.compile(r'(?:[Ii]terations?|iteration count)\s*[:=]\s*(\d+)')
+WINDOW = re.compile(r'Optimizing window (\d+)/(\d+)')
+GAP_PERCENT = re.compile(rf'[Gg]ap\b[^%\n]*?({NUMBER})\s*%')
+
+def parse_solver_line(line, solver):
+    # Updates the job's solver progress ({'iterations', 'objective', 'gap'}) from one line of solver output
+    simplex = SIMPLEX_ROW.match(line)
+    barrier = None if simplex else BARRIER_ROW.match(line)
+    cplex = CPLEX_ITERATION.search(line)
+    if simplex:
+        solver['iterations'], solver['objective'] = int(simplex.group(1)), float(simplex.group(2))
+    elif barrier:
+        primal, dual = float(barrier.group(2)), float(barrier.group(3))
+        solver['iterations'], solver['objective'] = int(barrier.group(1)), primal
+        solver['gap'] = abs(primal - dual) / max(1.0, abs(primal))
+    elif cplex:
+        solver['iterations'], solver['objective'] = int(cplex.group(1)), float(cplex.group(2))
+    else:
+        objective, iterations, gap = OBJECTIVE.search(line), ITERATIONS.search(line), GAP_PERCENT.search(line)
+        if objective:
+            solver['objective'] = float(objective.group(1))
+        if iterations:
+            solver['iterations'] = int(iterations.group(1))
+        if gap:
+            solver['gap'] = float(gap.group(1)) / 100
+
+def read_job_log(job_id):
+    # Returns the log text the job has written since the last call: its own log (model building) first,
+    # then the solver's.  Complete solver lines are parsed into the job's progress as they arrive.
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        return ""
+
+    new_text = []
+    text = _read_new_text(job, 0, job['log_paths'][0])
+    if text:
+        new_text.append(text)
+        windows = WINDOW.findall(text)
+        if windows and (int(windows[-1][0]), int(windows[-1][1])) != job['window']:
+            # A new window's solve starts from scratch, with its own solver log (see optimize_rolling_horizon)
+            job['window'] = (int(windows[-1][0]), int(windows[-1][1]))
+            job['solver'] = {'started': False, 'iterations': None, 'objective': None, 'gap': None}
+            job['log_offsets'][1] = 0
+            job['partial_line'] = ''
+
+    # Only the solver log of the window being solved, so no lines of the previous window are parsed into its progress
+    solver_log_path = job['log_paths'][1] if job['window'] is None else get_window_log_path(job['log_paths'][1], job['window'][0])
+    text = _read_new_text(job, 1, solver_log_path)
+    if text:
+        new_text.append(text)
+        job['solver']['started'] = True
+        lines = (job['partial_line'] + text).split('\n')
+        job['partial_line'] = lines.pop()  # Keep an unfinished last line until the rest is written
+        for line in lines:
+            parse_solver_line(line, job['solver'])
+
+    return "".join(new_text)
+
+def _read_new_text(job, i, path):
+    # Text written to the job's log 'i' (0: its own, 1: the solver's) at 'path' since it was last read
+    if not os.path.exists(path):
+        return ""
+    with open(path, 'r', errors='replace') as f:
+        f.seek(job['log_offsets'][i])
+        text = f.read()
+        job['log_offsets'][i] = f.tell()
+    return text
+
+def get_job_progress(job_id):
+    # Returns (percent, summary) for the progress bar.  Building the model counts for the first 10-40%; during
+    # the solve the gap between primal and dual objectives (where the solver reports one) is followed on a log
+    # scale down to 1e-8, otherwise the iteration count is used.  A rolling-horizon run splits the bar between
+    # its windows.  The bar never moves back, e.g. when a run turns out to have several windows.
+    with jobs_lock:
+        job = jobs.get(job_id)
+    if job is None:
+        return 0, ""
+    if not job['future'].running() and not job['future'].done():
+        return 0, "Queued"
+
+    solver = job['solver']
+    if not solver['started']:
+        elapsed = time.time() - (job['started'] or job['submitted'])
+        progress = 10 + 30 * elapsed / (elapsed + 30)
+        summary = "Building model"
+    else:
+        if solver['gap'] is not None:
+            progress = 40 + 55 * min(1, max(0, -math.log10(max(solver['gap'], 1e-8)) / 8))
+        elif solver['iterations'] is not None:
+            progress = 40 + 55 * solver['iterations'] / (solver['iterations'] + 5000)
+        else:
+            progress = 40
+
+        details = ["Solving"]
+        if solver['iterations'] is not None:
+            details.append(f"iteration {solver['iterations']}")
+        if solver['objective'] is not None:
+            details.append(f"objective {solver['objective']:.6g}")
+        if solver['gap'] is not None:
+            details.append(f"gap {solver['gap']:.2%}")
+        summary = ", ".join(details)
+
+    if job['window'] is not None and job['window'][1] > 1:
+        window, windows = job['window']
+        progress = (window - 1 + progress / 100) / windows * 100
+        summary = f"Window {window}/{windows}: {summary}"
+
+    progress = job['progress'] = max(progress, job['progress'])
+    return progress, summary
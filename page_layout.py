@@ -1,10 +1,11 @@
 import dash_bootstrap_components as dbc
 from dash import html, dcc, dash_table
 
-from external_functions import load_data, create_network, get_network_elements, get_network_elements_from_df, calc_aggregate_capacities
+from external_functions import load_data_table, get_network, network_cache_stats, get_network_elements, get_network_elements_from_df, calc_aggregate_capacities, EXPORT_FORMATS
 from model_checks import check_capacity_vs_demand, check_nodal_capacity_vs_demand, export_network_to_excel
 
-from results_charts import generate_result_charts
+from results_charts import generate_result_charts, generate_run_profile
+from results_store import load_results
 
 DATABASE_PATH = 'power_system.db'
 
@@ -24,7 +25,7 @@ def display_page(pathname, optimization_intent, optimization_results):
 
     # Determine content based on pathname
     if pathname == '/editor/power-plants':
-        power_plants_df = load_data(DATABASE_PATH)[0]
+        power_plants_df = load_data_table(DATABASE_PATH, 'power_plants')
         tab_content = html.Div([
             html.H2("System Editor: Power Plants", className='text-center my-4'),
             dash_table.DataTable(
@@ -38,7 +39,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'power-plants'}, n_clicks=0, className='btn btn-primary my-4')
     ])
     elif pathname == '/editor/buses':
-        buses_df = load_data(DATABASE_PATH)[1]
+        buses_df = load_data_table(DATABASE_PATH, 'buses')
         tab_content = html.Div([
             html.H2("System Editor: Buses", className='text-center my-4'),
             dash_table.DataTable(
@@ -52,7 +53,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'buses'}, n_clicks=0, className='btn btn-primary my-4')
         ])
     elif pathname == '/editor/lines':
-        lines_df = load_data(DATABASE_PATH)[2]
+        lines_df = load_data_table(DATABASE_PATH, 'lines')
         tab_content = html.Div([
             html.H2("System Editor: Lines", className='text-center my-4'),
             dash_table.DataTable(
@@ -66,7 +67,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'lines'}, n_clicks=0, className='btn btn-primary my-4')
         ])
     elif pathname == '/editor/demand-profile':
-        demand_df = load_data(DATABASE_PATH)[3]
+        demand_df = load_data_table(DATABASE_PATH, 'demand_profile')
         tab_content = html.Div([
             html.H2("System Editor: Demand Profile", className='text-center my-4'),
             dash_table.DataTable(
@@ -80,7 +81,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'demand-profile'}, n_clicks=0, className='btn btn-primary my-4')
         ])
     elif pathname == '/editor/storage-units':
-        storage_units_df = load_data(DATABASE_PATH)[4]
+        storage_units_df = load_data_table(DATABASE_PATH, 'storage_units')
         tab_content = html.Div([
             html.H2("System Editor: Storage Units", className='text-center my-4'),
             dash_table.DataTable(
@@ -94,7 +95,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'storage-units'}, n_clicks=0, className='btn btn-primary my-4')
         ])
     elif pathname == '/editor/wind-profile':
-        wind_profile_df = load_data(DATABASE_PATH)[6]
+        wind_profile_df = load_data_table(DATABASE_PATH, 'wind_profile')
         tab_content = html.Div([
             html.H2("System Editor: Wind Profile", className='text-center my-4'),
             dash_table.DataTable(
@@ -108,7 +109,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'wind-profile'}, n_clicks=0, className='btn btn-primary my-4')
         ])
     elif pathname == '/editor/solar-profile':
-        solar_profile_df = load_data(DATABASE_PATH)[7]
+        solar_profile_df = load_data_table(DATABASE_PATH, 'solar_profile')
         tab_content = html.Div([
             html.H2("System Editor: Solar Profile", className='text-center my-4'),
             dash_table.DataTable(
@@ -122,8 +123,7 @@ def display_page(pathname, optimization_intent, optimization_results):
             html.Button("Save Changes", id={'type': 'save-changes-btn', 'index': 'solar-profile'}, n_clicks=0, className='btn btn-primary my-4')
         ])
     elif pathname == '/diagram':
-        power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df = load_data(DATABASE_PATH)    # Reload the data from the database
-        network = create_network(power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df)
+        network = get_network(DATABASE_PATH)    # Reuses the cached network unless the database has changed
         network_data = get_network_elements(network)
 
         # Create a network graph using D3
@@ -145,7 +145,7 @@ def display_page(pathname, optimization_intent, optimization_results):
         ])
     
     elif pathname == '/settings':
-        snapshots_df = load_data(DATABASE_PATH)[5]
+        snapshots_df = load_data_table(DATABASE_PATH, 'snapshots')
         tab_content = html.Div([
             html.H2("Settings", className='text-center my-4'),
             dash_table.DataTable(
@@ -168,13 +168,18 @@ def display_page(pathname, optimization_intent, optimization_results):
         # If there are already stored results, return them
         elif optimization_results:
             print("Loading previous results...")
-            # Load stored results from JSON
-            optimization_results_dict = optimization_results
+            # Load the stored results from the server's results store
+            optimization_results_dict = load_results(optimization_results.get('result_id'))
 
-            run_output = "Loaded previous results"
+            if optimization_results_dict is None:
+                run_output = "Previous results are no longer available, run optimization again"
+                charts_html = "No optimization results available"
+            else:
+                run_output = "Loaded previous results"
 
-            # Generate charts from stored results
-            charts_html = generate_result_charts(optimization_results_dict)
+                # Generate charts from stored results, followed by the run's stage timings
+                charts_html = html.Div([generate_result_charts(optimization_results_dict),
+                                        generate_run_profile(optimization_results_dict.get('instrumentation'))])
         else:
             run_output = "Run optimization using the button to the left"
             charts_html = "No optimization results available"
@@ -188,9 +193,8 @@ def display_page(pathname, optimization_intent, optimization_results):
 
     elif pathname == '/debug':
         
-        # Load network data and create a network instance
-        power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df = load_data(DATABASE_PATH)
-        network = create_network(power_plants_df, buses_df, lines_df, demand_df, storage_units_df, snapshots_df, wind_profile_df, solar_profile_df)
+        # Get the network instance (built from the database, or reused from the cache)
+        network = get_network(DATABASE_PATH)
 
         # Perform the capacity vs demand summary
         capacity_check_summary = check_capacity_vs_demand(network)
@@ -212,7 +216,8 @@ def display_page(pathname, optimization_intent, optimization_results):
 
         tab_content = html.Div([
             html.H2("Model Debug", className='text-center my-4'),
-            html.Div(debug_table)
+            html.Div(debug_table),
+            html.P(f"Network cache: {network_cache_stats['hits']} hits, {network_cache_stats['misses']} misses", className='text-center text-secondary')
         ])
 
     elif pathname == '/dashboard':
@@ -426,6 +431,11 @@ def get_menu_layout():
             className="w-100 mt-2"
         ),
         dcc.Download(id="download-network-excel"),  # Download component for network data
+        html.Div([
+            html.Span("Large models: ", className="text-white-50"),
+            *[html.A(f"{export_format.upper()} (zip) ", href=f"/download/network_data_{export_format}.zip", download=f"network_data_{export_format}.zip", className="text-white-50 me-2")
+              for export_format in EXPORT_FORMATS]
+        ], className="small mt-1 text-center"),
         dbc.Button(
             [html.I(className="bi bi-upload me-2"), "Upload Network Data"],
             id="upload-network-btn",
@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow is optional; without it profiles are always read from SQLite
+    pa = None
+
+# Wide layout of each profile table: the column whose values become the file's columns, the timestamp
+# column (the file's rows), the value column, and the column order of the table in the database
+PROFILE_TABLES = {
+    'demand_profile': ('bus_id', 'snapshot', 'demand_mw', ['id', 'bus_id', 'demand_mw', 'snapshot']),
+    'wind_profile': ('profile_name', 'snapshot_time', 'profile', ['id', 'profile_name', 'snapshot_time', 'profile']),
+    'solar_profile': ('profile_name', 'snapshot_time', 'profile', ['id', 'profile_name', 'snapshot_time', 'profile'])
+}
+
+
+def get_store_dir(DATABASE_PATH):
+    return DATABASE_PATH + '.profiles'
+
+def get_store_path(DATABASE_PATH, table_name):
+    return os.path.join(get_store_dir(DATABASE_PATH), table_name + '.arrow')
+
+def store_enabled(DATABASE_PATH):
+    # The store is used once its directory exists (see build_profile_store) and pyarrow is installed
+    return pa is not None and os.path.isdir(get_store_dir(DATABASE_PATH))
+
+
+def write_profile_matrix(DATABASE_PATH, table_name, long_df, version):
+    # Writes a long profile table as a wide Arrow IPC file (one column per bus or profile name), tagged with
+    # the table version it was made from.  Tables that can't be pivoted (duplicate snapshots) are not stored.
+    key_column, time_column, value_column, _ = PROFILE_TABLES[table_name]
+    try:
+        wide = long_df.pivot(index=time_column, columns=key_column, values=value_column).sort_index()
+    except ValueError:
+        return False
+
+    arrays = [pa.array(wide.index.values)] + [pa.array(wide[key].to_numpy(dtype='float64')) for key in wide.columns]
+    names = [time_column] + [str(key) for key in wide.columns]
+    metadata = {
+        'version': str(version),
+        'key_type': 'int' if pd.api.types.is_integer_dtype(wide.columns) else 'str'
+    }
+    table = pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(metadata)
+
+    # Write to a temporary file and move it into place, so readers never map a half-written file
+    path = get_store_path(DATABASE_PATH, table_name)
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+    return True
+
+def read_profile_matrix(DATABASE_PATH, table_name, columns=None, version=None):
+    # Returns the wide snapshots x (bus or profile name) matrix from the store, memory-mapped so only the
+    # selected columns are paged in.  Returns None if there is no stored file or it is not for 'version'.
+    path = get_store_path(DATABASE_PATH, table_name)
+    if not os.path.exists(path):
+        return None
+
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+    if version is not None and metadata.get('version') != str(version):
+        return None
+
+    _, time_column, _, _ = PROFILE_TABLES[table_name]
+    if columns is not None:
+        table = table.select([time_column] + [str(column) for column in columns if str(column) in table.column_names])
+
+    # split_blocks keeps each column as its own (memory-mapped) array instead of copying into one block
+    wide = table.to_pandas(split_blocks=True).set_index(time_column)
+    if metadata.get('key_type') == 'int':
+        wide.columns = wide.columns.astype('int64')
+    return wide
+
+def read_profile_table(DATABASE_PATH, table_name, version=None):
+    # Returns the profile table in the database's long format, rebuilt from the wide file.  The ids are
+    # renumbered, so tables that will be edited and saved back must be read from the database instead.
+    wide = read_profile_matrix(DATABASE_PATH, table_name, version=version)
+    if wide is None:
+        return None
+
+    key_column, time_column, value_column, table_columns = PROFILE_TABLES[table_name]
+    values = wide.to_numpy().ravel(order='F')  # One key after another, as the tables are usually ordered
+    present = ~np.isnan(values)
+    long_df = pd.DataFrame({
+        key_column: np.repeat(wide.columns.values, len(wide.index))[present],
+        time_column: np.tile(wide.index.values, len(wide.columns))[present],
+        value_column: values[present]
+    })
+    long_df['id'] = np.arange(1, len(long_df) + 1)
+    return long_df[table_columns]
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import uuid
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from result_format import RESULT_SERIES
+
+logger = logging.getLogger(__name__)
+
+# Finished optimization results are kept on disk, keyed by a fingerprint of everything the solve depends on, so an
+# identical run returns them instead of solving again.  The least recently used results are evicted once the
+# cache holds more than RESULT_CACHE_MB (0 turns the cache off).  Each result is one .npz file of its matrices
+# and its other entries as UTF-8 JSON, read back without unpickling anything.  A cache directory that another user owns
+# or could write to is not used.
+RESULT_CACHE_DIR = os.environ.get('CLEANPOWERSIM_RESULT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'cleanpowersim_results')
+RESULT_CACHE_MB = float(os.environ.get('CLEANPOWERSIM_RESULT_CACHE_MB', 1024))
+
+# Bumped whenever the format of the cached results changes, so older entries are never returned
+RESULT_CACHE_VERSION = 3
+
+# Components and input attributes PyPSA fills in itself when it determines the network topology, and which
+# the dispatch optimization doesn't use
+DERIVED_COMPONENTS = ['SubNetwork']
+DERIVED_ATTRIBUTES = ['control']
+
+
+def fingerprint_network(network, **settings):
+    # Fingerprint of the optimization inputs of 'network' - every input attribute of its components, the snapshots
+    # and their weightings, and its metadata - together with the given settings (solver names and options,
+    # horizon, ...).  Outputs of an earlier solve are left out, so a solved network keeps the same fingerprint.
+    digest = hashlib.sha256(f"v{RESULT_CACHE_VERSION}".encode())
+    _hash_frame(digest, network.snapshot_weightings)
+
+    # iterate_components' order depends on the hash seed, so take the components by name to get the same
+    # fingerprint in every process
+    for component in sorted(network.iterate_components(), key=lambda component: component.name):
+        if component.name in DERIVED_COMPONENTS:
+            continue
+        inputs = component.defaults.index[component.defaults['status'].str.startswith('Input')].difference(DERIVED_ATTRIBUTES)
+        static = component.static
+        digest.update(component.name.encode())
+        _hash_frame(digest, static[[column for column in static.columns if column in inputs]])
+        for attribute in sorted(component.dynamic):
+            if attribute in inputs and not component.dynamic[attribute].empty:
+                digest.update(attribute.encode())
+                _hash_frame(digest, component.dynamic[attribute])
+
+    digest.update(json.dumps([dict(network.meta), settings], sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def _hash_frame(digest, df):
+    digest.update(json.dumps([str(column) for column in df.columns]).encode())
+    if len(df):
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+
+def _cache_path(key):
+    return os.path.join(RESULT_CACHE_DIR, f'{key}.npz')
+
+def _cache_dir_is_private():
+    # True if only this user can have written to the cache directory (not checked where there are no user ids)
+    if not hasattr(os, 'getuid'):
+        return True
+    stat = os.stat(RESULT_CACHE_DIR)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        logger.warning("Not using the result cache in %s: it is not private to this user", RESULT_CACHE_DIR)
+        return False
+    return True
+
+def _json_value(value):
+    # NumPy scalars (in solver info and summaries) as plain Python values
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+def get_cached_result(key):
+    # Returns the result stored under 'key', or None, marking it as recently used
+    path = _cache_path(key)
+    if not os.path.exists(path) or not _cache_dir_is_private():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            result = json.loads(data['result'].tobytes())
+            for name in RESULT_SERIES:
+                if name in data:
+                    result[name]['values'] = data[name]
+        os.utime(path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+    return result
+
+def store_result(key, result):
+    # Stores 'result' (compact results, or a dict of plain values) under 'key', then evicts the least recently used
+    # results beyond the size limit.  The file is written under a temporary name and renamed, so other processes
+    # never read a partly written result.
+    if not RESULT_CACHE_MB:
+        return
+    os.makedirs(RESULT_CACHE_DIR, mode=0o700, exist_ok=True)
+    if not _cache_dir_is_private():
+        return
+
+    arrays = {name: result[name]['values'] for name in RESULT_SERIES if isinstance(result.get(name), dict) and 'values' in result[name]}
+    metadata = {name: {k: v for k, v in value.items() if k != 'values'} if name in arrays else value for name, value in result.items()}
+    temporary_path = os.path.join(RESULT_CACHE_DIR, f'{key}.{uuid.uuid4().hex}.tmp')
+    with open(temporary_path, 'wb') as f:
+        np.savez(f, result=np.frombuffer(json.dumps(metadata, default=_json_value).encode(), dtype=np.uint8), **arrays)
+    os.replace(temporary_path, _cache_path(key))
+    evict_results()
+
+def evict_results(max_mb=None):
+    # Removes the least recently used results until the cache holds at most 'max_mb' (default RESULT_CACHE_MB)
+    max_bytes = (RESULT_CACHE_MB if max_mb is None else max_mb) * 2**20
+    entries = []
+    for entry in os.scandir(RESULT_CACHE_DIR) if os.path.isdir(RESULT_CACHE_DIR) else []:
+        if entry.name.endswith('.pkl'):  # Written by earlier versions, and never read now
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        elif entry.name.endswith('.npz'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # Evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def clear_result_cache():
+    evict_results(0)
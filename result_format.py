@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Optimization results come in two layouts.  The compact one (run_optimization's default) holds the snapshots
+# once and each time series as a snapshots x components float32 matrix with the component names beside it:
+#   {'format': 'compact', 'snapshots': [...],
+#    'generators_t_p': {'names': [...], 'types': [...], 'values': array},
+#    'storage_units_t_p': {'names': [...], 'values': array},
+#    'buses_t_marginal_price': {'names': [...], 'values': array},
+#    'solver': {...}, 'windows': [...]}
+# The dict layout keeps each time series as {component: {snapshot: value}}, with generators_t_p as
+# {'data': {...}, 'types': {generator: type}}.  results_to_dict and results_from_dict convert between them.
+# Results meant for the dict layout are built in float64 (dtype=np.float64), so it keeps the solver's values.
+RESULT_SERIES = ['generators_t_p', 'storage_units_t_p', 'buses_t_marginal_price']
+RESULT_DTYPE = np.float32
+
+
+def is_compact(optimization_results):
+    return optimization_results.get('format') == 'compact'
+
+def compact_results(snapshots, series, generator_types=None, dtype=RESULT_DTYPE, **extra):
+    # Builds compact results from time series DataFrames ({name: snapshots x components}, rows in the order of
+    # 'snapshots') and the generators' types ({generator: type}), with matrices of 'dtype'.  'extra' entries
+    # (solver, windows) are kept as is.
+    snapshots = [str(snapshot) for snapshot in snapshots]
+    optimization_results = {'format': 'compact', 'snapshots': snapshots}
+    for name in RESULT_SERIES:
+        df = series.get(name)
+        names = [] if df is None else [str(column) for column in df.columns]
+        values = np.empty((len(snapshots), 0), dtype=dtype) if not names else np.ascontiguousarray(df.to_numpy(dtype=dtype))
+        optimization_results[name] = {'names': names, 'values': values}
+
+    generator_types = generator_types if generator_types is not None else {}
+    optimization_results['generators_t_p']['types'] = [generator_types.get(name) for name in optimization_results['generators_t_p']['names']]
+    optimization_results.update(extra)
+    return optimization_results
+
+def results_from_dict(optimization_results):
+    # Compact results from results in the dict layout (compact results are returned as they are)
+    if is_compact(optimization_results):
+        return optimization_results
+    snapshots = [str(snapshot) for snapshot in optimization_results['snapshots']]
+    series = {name: pd.DataFrame(_legacy_data(optimization_results, name)).reindex(snapshots) for name in RESULT_SERIES}
+    extra = {key: value for key, value in optimization_results.items() if key not in RESULT_SERIES and key != 'snapshots'}
+    return compact_results(snapshots, series, optimization_results['generators_t_p'].get('types'), **extra)
+
+def results_to_dict(optimization_results):
+    # Results in the dict layout (see above), as run_optimization returned them before the compact layout.  The
+    # values are those of the matrices: exact from float64 results, rounded to float32 precision from float32 ones.
+    if not is_compact(optimization_results):
+        return optimization_results
+    snapshots = optimization_results['snapshots']
+    legacy = {key: value for key, value in optimization_results.items() if key not in RESULT_SERIES and key != 'format'}
+    for name in RESULT_SERIES:
+        entry = optimization_results[name]
+        legacy[name] = pd.DataFrame(np.asarray(entry['values'], dtype=np.float64), index=snapshots, columns=entry['names']).to_dict()
+    legacy['generators_t_p'] = {'data': legacy['generators_t_p'], 'types': get_generator_types(optimization_results)}
+    return legacy
+
+def get_series(optimization_results, name):
+    # Time series 'name' (see RESULT_SERIES) as a DataFrame indexed by snapshot time, from results in either layout.
+    # Values are float64, so totals over many snapshots don't lose precision.
+    if is_compact(optimization_results):
+        entry = optimization_results[name]
+        return pd.DataFrame(np.asarray(entry['values'], dtype=np.float64), index=pd.to_datetime(optimization_results['snapshots']), columns=entry['names'])
+    df = pd.DataFrame(_legacy_data(optimization_results, name))
+    df.index = pd.to_datetime(df.index)
+    return df
+
+def get_generator_types(optimization_results):
+    # {generator: type} from results in either layout
+    if is_compact(optimization_results):
+        entry = optimization_results['generators_t_p']
+        return dict(zip(entry['names'], entry['types']))
+    return dict(optimization_results['generators_t_p']['types'])
+
+def _legacy_data(optimization_results, name):
+    data = optimization_results.get(name) or {}
+    return data.get('data', {}) if name == 'generators_t_p' else data
@@ -4,6 +4,8 @@ import plotly.graph_objects as go
 import pandas as pd
 
 from external_functions import load_data_table
+from result_format import get_series, get_generator_types
+from instrumentation import summarize_stages
 DATABASE_PATH = 'power_system.db'
 
 def generate_result_charts(optimization_results):
@@ -14,18 +16,19 @@ def generate_result_charts(optimization_results):
 
     print("Generating result charts...")
 
+    # Results may be in the compact or the dict layout (see result_format)
     snapshots = pd.to_datetime(optimization_results["snapshots"])
-    generation_data = pd.DataFrame(optimization_results["generators_t_p"]["data"])
-    generator_types = optimization_results["generators_t_p"]["types"]
-    shadow_prices = pd.DataFrame(optimization_results["buses_t_marginal_price"])
-    storage_data = pd.DataFrame(optimization_results.get("storage_units_t_p", {}))
+    generation_data = get_series(optimization_results, "generators_t_p")
+    generator_types = get_generator_types(optimization_results)
+    shadow_prices = get_series(optimization_results, "buses_t_marginal_price")
+    storage_data = get_series(optimization_results, "storage_units_t_p")
 
     graphs_list = []
 
     # Calculate Summary Statistics
     avg_price = shadow_prices.mean().mean()  # Time-averaged, node-averaged
     load_weighted_avg_price = (shadow_prices * generation_data.sum(axis=1)).sum().sum() / generation_data.sum().sum()
-    renewable_generation = generation_data.loc[:, [col for col, type in optimization_results["generators_t_p"]["types"].items() if type in ['Wind', 'Solar', 'Nuclear', 'Biomass']]].sum().sum()
+    renewable_generation = generation_data.loc[:, [col for col, type in generator_types.items() if type in ['Wind', 'Solar', 'Nuclear', 'Biomass']]].sum().sum()
     total_generation = generation_data.sum().sum()
     renewable_percentage = (renewable_generation / total_generation) * 100 if total_generation > 0 else 0  # Avoid division by zero
 
@@ -229,6 +232,31 @@ def generate_result_charts(optimization_results):
 
 
 
+def generate_run_profile(instrumentation):
+    # Table of the time and memory each stage of the run took, and the size of the LP it solved
+    if not instrumentation or not instrumentation.get('stages'):
+        return []
+
+    rows = [html.Tr([
+        html.Td(stage['stage'] + (f" (x{stage['count']})" if stage['count'] > 1 else "")),
+        html.Td(f"{stage['wall_time']:.2f}"),
+        html.Td(f"{stage['cpu_time']:.2f}"),
+        html.Td(f"{stage['peak_rss_mb']:.0f}" if stage['peak_rss_mb'] is not None else "")
+    ]) for stage in summarize_stages(instrumentation['stages'])]
+
+    lp = instrumentation.get('lp')
+    lp_size = f"LP size: {lp['variables']:,} variables, {lp['constraints']:,} constraints, {lp['nonzeros']:,} nonzeros" if lp else ""
+
+    return html.Div([
+        html.H4("Run Profile"),
+        dbc.Table([
+            html.Thead(html.Tr([html.Th("Stage"), html.Th("Wall time (s)"), html.Th("CPU time (s)"), html.Th("Peak memory (MB)")])),
+            html.Tbody(rows)
+        ], bordered=True, hover=True, size='sm'),
+        html.P(lp_size)
+    ], className='my-4')
+
+
 def generate_dashboard_chart():
     
     # Load demand and generation data
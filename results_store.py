@@ -0,0 +1,67 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+
+from result_format import RESULT_SERIES, results_from_dict
+
+# Optimization results are kept on the server, one folder per result, and the browser only holds the result id.
+# The most recent RESULTS_KEEP results are kept.
+RESULTS_DIR = os.environ.get('CLEANPOWERSIM_RESULTS_DIR') or os.path.join(tempfile.gettempdir(), 'cleanpowersim_results_store')
+RESULTS_KEEP = int(os.environ.get('CLEANPOWERSIM_RESULTS_KEEP', 20))
+
+
+def get_result_dir(result_id):
+    # Result ids come back from the browser, so only ever accept the ids save_results makes
+    if not isinstance(result_id, str) or not re.fullmatch(r'[0-9a-f]{32}', result_id):
+        return None
+    return os.path.join(RESULTS_DIR, result_id)
+
+def save_results(optimization_results):
+    # Stores results (in either layout, see result_format) in the compact layout and returns their id.  Each
+    # time series matrix is saved as a column-major float32 .npy file, so one component's series is contiguous on
+    # disk; the snapshots, component names and everything else go to JSON.
+    optimization_results = results_from_dict(optimization_results)
+    result_id = uuid.uuid4().hex
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    temporary_dir = os.path.join(RESULTS_DIR, f'{result_id}.tmp')
+    os.makedirs(temporary_dir)
+
+    metadata = dict(optimization_results)
+    for name in RESULT_SERIES:
+        metadata[name] = {key: value for key, value in optimization_results[name].items() if key != 'values'}
+        np.save(os.path.join(temporary_dir, f'{name}.npy'), np.asfortranarray(optimization_results[name]['values']))
+
+    with open(os.path.join(temporary_dir, 'results.json'), 'w') as f:
+        json.dump(metadata, f, default=str)
+
+    # Readers only ever see complete results
+    os.replace(temporary_dir, get_result_dir(result_id))
+    evict_results()
+    return result_id
+
+def load_results(result_id):
+    # Returns the stored results in the compact layout, with the matrices memory-mapped, or None if unknown
+    result_dir = get_result_dir(result_id)
+    if result_dir is None or not os.path.isdir(result_dir):
+        return None
+
+    with open(os.path.join(result_dir, 'results.json')) as f:
+        optimization_results = json.load(f)
+    for name in RESULT_SERIES:
+        optimization_results[name]['values'] = np.load(os.path.join(result_dir, f'{name}.npy'), mmap_mode='r')
+    return optimization_results
+
+def evict_results(keep=None):
+    # Removes all but the 'keep' (default RESULTS_KEEP) most recently saved results
+    keep = RESULTS_KEEP if keep is None else keep
+    if not os.path.isdir(RESULTS_DIR):
+        return
+    result_dirs = sorted((entry for entry in os.scandir(RESULTS_DIR) if entry.is_dir() and get_result_dir(entry.name)),
+                         key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in result_dirs[keep:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,151 @@
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_reuse import get_model, solve_model
+from result_cache import RESULT_CACHE_MB, fingerprint_network, get_cached_result, store_result
+from solvers import get_available_solvers, get_solver_options
+
+logger = logging.getLogger(__name__)
+
+# Number of scenarios solved at once
+SWEEP_WORKERS = int(os.environ.get('CLEANPOWERSIM_SWEEP_WORKERS', os.cpu_count() or 1))
+
+# Plant types the dashboard sliders scale, and the types counted as renewable in the summaries
+SWEEP_TYPES = ['Solar', 'Wind', 'DSR']
+RENEWABLE_TYPES = ['Wind', 'Solar', 'ROR', 'Biomass', 'Biogas', 'BECCS', 'Other RES']
+
+# Each worker process keeps its own copy of the base network and its original capacities
+base_network = None
+base_p_nom = None
+
+
+def scenario_grid(multipliers):
+    # Every combination of the given capacity multipliers, e.g. {'Solar': [0.5, 1, 2], 'Wind': [1, 1.5]}
+    types = list(multipliers)
+    return [dict(zip(types, values)) for values in itertools.product(*(multipliers[plant_type] for plant_type in types))]
+
+def latin_hypercube(ranges, n_samples, seed=0):
+    # 'n_samples' scenarios whose multipliers are spread over the given (low, high) ranges, e.g.
+    # {'Solar': (0.5, 2), 'Wind': (0.5, 2), 'DSR': (0, 3)}, taking each of n equal slices of every range once
+    rng = np.random.default_rng(seed)
+    scenarios = [{} for _ in range(n_samples)]
+    for plant_type, (low, high) in ranges.items():
+        slices = (rng.permutation(n_samples) + rng.random(n_samples)) / n_samples
+        for scenario, position in zip(scenarios, slices):
+            scenario[plant_type] = low + (high - low) * position
+    return scenarios
+
+def scale_network(network, multipliers, p_nom=None):
+    # Sets each plant type's capacity to 'p_nom' (default: the current capacity) times its multiplier, scaling
+    # every plant of the type by the same factor as the dashboard sliders do (see scale_plant_capacities)
+    p_nom = network.generators['p_nom'].copy() if p_nom is None else p_nom
+    factors = network.generators['type'].map(multipliers).fillna(1)
+    network.generators['p_nom'] = p_nom * factors
+    return network
+
+def summarize_network(network):
+    # Compact summary of a solved network: demand-weighted average price, renewable share of generation, total
+    # generation and curtailment of the plants with an availability profile (MWh, weighted by snapshot)
+    weights = network.snapshot_weightings['generators']
+    generation = network.generators_t.p.mul(weights, axis=0)
+    total_generation = generation.sum().sum()
+    renewable = network.generators.index[network.generators['type'].isin(RENEWABLE_TYPES)]
+
+    profiled = network.generators_t.p_max_pu.columns.intersection(network.generators.index)
+    available = network.generators_t.p_max_pu[profiled] * network.generators.loc[profiled, 'p_nom']
+    curtailment = (available - network.generators_t.p[profiled]).clip(lower=0).mul(weights, axis=0).sum().sum()
+
+    demand = network.loads_t.p_set.T.groupby(network.loads['bus']).sum().T.reindex(columns=network.buses.index, fill_value=0)
+    prices = network.buses_t.marginal_price.reindex(columns=network.buses.index)
+    weighted_demand = demand.mul(network.snapshot_weightings['objective'], axis=0)
+    average_price = (prices * weighted_demand).sum().sum() / weighted_demand.sum().sum() if weighted_demand.sum().sum() else np.nan
+
+    return {
+        'average_price': average_price,
+        'renewable_share': generation[renewable].sum().sum() / total_generation if total_generation else np.nan,
+        'total_generation_mwh': total_generation,
+        'curtailment_mwh': curtailment,
+        'objective': network.objective
+    }
+
+def _init_worker(network):
+    global base_network, base_p_nom
+    base_network = network
+    base_p_nom = network.generators['p_nom'].copy()
+
+def _run_scenario(multipliers, solver_name, solver_settings):
+    # Solves one scenario on the worker's base network, rescaled from its original capacities.  Only capacities
+    # change between scenarios, so the worker builds the model once and updates it for each scenario.
+    start_time = time.perf_counter()
+    scale_network(base_network, multipliers, base_p_nom)
+
+    # Scenarios already solved, in this sweep or an earlier one, come from the result cache
+    cache_key = None
+    if RESULT_CACHE_MB:
+        solvers = [solver_name] if solver_name else get_available_solvers()
+        cache_key = fingerprint_network(base_network, solvers={solver: get_solver_options(solver, solver_settings) for solver in solvers},
+                                        summary='scenario_sweep')
+        summary = get_cached_result(cache_key)
+        if summary is not None:
+            return {**multipliers, **summary, 'status': 'cached', 'time': time.perf_counter() - start_time}
+
+    try:
+        solver_info = solve_model(get_model(base_network), solver_name, solver_settings)
+    except Exception as e:
+        return {**multipliers, 'status': 'failed', 'error': str(e), 'time': time.perf_counter() - start_time}
+    summary = {**summarize_network(base_network), 'solver': solver_info['name']}
+    if cache_key:
+        store_result(cache_key, summary)
+    return {**multipliers, **summary, 'status': 'ok', 'time': time.perf_counter() - start_time}
+
+def run_sweep(network, scenarios, workers=SWEEP_WORKERS, solver_name=None, solver_settings=None):
+    # Solves 'network' once per scenario ({type: multiplier}, see scenario_grid and latin_hypercube) across a
+    # pool of worker processes.  Each worker receives the network once and rescales it for every scenario
+    # instead of rebuilding it.  Returns one row of multipliers and summary figures per scenario.
+    start_time = time.perf_counter()
+    workers = max(1, min(workers, len(scenarios)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(network,)) as executor:
+        futures = [executor.submit(_run_scenario, scenario, solver_name, solver_settings) for scenario in scenarios]
+        rows = []
+        for i, future in enumerate(futures):
+            rows.append(future.result())
+            logger.info("Scenario %d/%d: %s (%.1f s)", i + 1, len(scenarios), rows[-1]['status'], rows[-1]['time'])
+
+    logger.info("Swept %d scenarios on %d workers in %.1f s", len(scenarios), workers, time.perf_counter() - start_time)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    from external_functions import get_network
+
+    parser = argparse.ArgumentParser(description="Solve the network for a sweep of solar, wind and DSR capacity multipliers")
+    parser.add_argument('--database', default='power_system.db')
+    for plant_type in SWEEP_TYPES:
+        parser.add_argument(f'--{plant_type.lower()}', type=float, nargs='+', default=[1.0],
+                            help=f"{plant_type} multipliers (grid), or low and high (with --samples)")
+    parser.add_argument('--samples', type=int, default=0, help="Latin hypercube samples instead of a grid")
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS)
+    parser.add_argument('--solver', default=None)
+    parser.add_argument('--output', default='scenario_sweep.csv')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    logger.setLevel(logging.INFO)  # Show the sweep's progress, without every solver message
+
+    multipliers = {plant_type: getattr(args, plant_type.lower()) for plant_type in SWEEP_TYPES}
+    if args.samples:
+        scenarios = latin_hypercube({plant_type: (min(values), max(values)) for plant_type, values in multipliers.items()}, args.samples)
+    else:
+        scenarios = scenario_grid(multipliers)
+
+    results = run_sweep(get_network(args.database), scenarios, args.workers, args.solver)
+    results.to_csv(args.output, index=False)
+    print(f"Results written to {args.output}")
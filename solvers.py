@@ -0,0 +1,134 @@
+import logging
+import os
+import time
+
+import linopy
+
+from instrumentation import track_stage, get_lp_size
+
+logger = logging.getLogger(__name__)
+
+# Solvers this app knows how to tune, fastest first for the LP dispatch problems it builds
+SOLVER_PREFERENCE = ['cplex', 'highs', 'cbc', 'glpk']
+
+# Solvers that linopy can warm start from a basis file written by a previous solve
+WARMSTART_SOLVERS = ['cplex', 'highs', 'cbc', 'glpk']
+
+# Generic solver settings, translated to each solver's own option names by get_solver_options.  None leaves the
+# solver's default.  'method' is one of 'auto', 'primal', 'dual' or 'barrier'.
+DEFAULT_SOLVER_SETTINGS = {
+    'threads': int(os.environ.get('CLEANPOWERSIM_SOLVER_THREADS', 0)) or None,
+    'method': os.environ.get('CLEANPOWERSIM_SOLVER_METHOD') or None,
+    'presolve': True,
+    'tolerance': None
+}
+
+
+def get_available_solvers():
+    # Returns the installed solvers in order of preference.  A solver named by CLEANPOWERSIM_SOLVER comes first.
+    solvers = [solver for solver in SOLVER_PREFERENCE if solver in linopy.available_solvers]
+    preferred = os.environ.get('CLEANPOWERSIM_SOLVER')
+    if preferred in solvers:
+        solvers.remove(preferred)
+        solvers.insert(0, preferred)
+    return solvers
+
+def get_solver_options(solver_name, settings=None):
+    # Translates generic settings (see DEFAULT_SOLVER_SETTINGS) into options for 'solver_name'.  Settings the
+    # solver has no equivalent for are skipped.
+    settings = {**DEFAULT_SOLVER_SETTINGS, **(settings or {})}
+    threads, method, presolve, tolerance = settings['threads'], settings['method'], settings['presolve'], settings['tolerance']
+    options = {}
+
+    if solver_name == 'highs':
+        if threads:
+            options['threads'] = threads
+        options.update({
+            'primal': {'solver': 'simplex', 'simplex_strategy': 4},
+            'dual': {'solver': 'simplex', 'simplex_strategy': 1},
+            'barrier': {'solver': 'ipm'}
+        }.get(method, {}))
+        if presolve is not None:
+            options['presolve'] = 'on' if presolve else 'off'
+        if tolerance:
+            options.update({'primal_feasibility_tolerance': tolerance, 'dual_feasibility_tolerance': tolerance, 'ipm_optimality_tolerance': tolerance})
+
+    elif solver_name == 'cplex':
+        if threads:
+            options['threads'] = threads
+        if method:
+            options['lpmethod'] = {'auto': 0, 'primal': 1, 'dual': 2, 'barrier': 4}[method]
+        if presolve is not None:
+            options['preprocessing.presolve'] = int(bool(presolve))
+        if tolerance:
+            options.update({'simplex.tolerances.feasibility': tolerance, 'simplex.tolerances.optimality': tolerance, 'barrier.convergetol': tolerance})
+
+    elif solver_name == 'cbc':
+        # cbc's method switches solve straight away on its command line, so only threads, presolve and tolerances apply
+        if threads:
+            options['threads'] = threads
+        if presolve is not None:
+            options['presolve'] = 'on' if presolve else 'off'
+        if tolerance:
+            options.update({'primalTolerance': tolerance, 'dualTolerance': tolerance})
+
+    elif solver_name == 'glpk':
+        # glpsol is single-threaded and has no tolerance switches
+        if method == 'barrier':
+            options['interior'] = ''
+        elif method in ('primal', 'dual'):
+            options['simplex'] = ''
+        if presolve is not None:
+            options['presol' if presolve else 'nopresol'] = ''
+
+    return options
+
+def solve_network(network, solver_name=None, settings=None, log_fn=None, snapshots=None, reuse_model=False, basis_fn=None):
+    # Optimizes 'network' over 'snapshots' (default all) with 'solver_name', or with the first available solver
+    # that succeeds.  A solver that fails to run (missing licence, crash) is skipped for the next one; an infeasible
+    # or unbounded model is not, as no other solver would do better.  With 'reuse_model' the model already built
+    # on the network (network.model) is solved instead of building one.  Solvers that support it save their final
+    # basis to 'basis_fn' and start from the basis already there.
+    # Returns {'name', 'options', 'solve_time', 'status', 'condition', 'warm_start'}.
+    solvers = [solver_name] if solver_name else get_available_solvers()
+    if not solvers:
+        raise RuntimeError(f"None of the supported solvers ({', '.join(SOLVER_PREFERENCE)}) is installed")
+
+    # The model is built once, and solved again by the next solver if one fails
+    if not reuse_model:
+        with track_stage('model build') as stage:
+            network.optimize.create_model(snapshots)
+            stage.update(get_lp_size(network.model))
+
+    errors = []
+    for solver in solvers:
+        options = get_solver_options(solver, settings)
+        logger.info("Solving with %s (options: %s)", solver, options or "defaults")
+        solve_options = {'log_fn': log_fn} if log_fn else {}
+        warm_start = bool(basis_fn) and solver in WARMSTART_SOLVERS and os.path.exists(basis_fn)
+        if basis_fn and solver in WARMSTART_SOLVERS:
+            solve_options['basis_fn'] = basis_fn
+        if warm_start:
+            solve_options['warmstart_fn'] = basis_fn
+
+        start_time = time.perf_counter()
+        try:
+            with track_stage('solve', solver=solver):
+                status, condition = network.optimize.solve_model(solver_name=solver, solver_options=options, **solve_options)
+        except Exception as e:
+            logger.warning("%s failed: %s", solver, e)
+            errors.append(f"{solver}: {e}")
+            continue
+        solve_time = time.perf_counter() - start_time
+
+        if status != 'ok':
+            if condition in ('infeasible', 'unbounded', 'infeasible_or_unbounded'):
+                raise RuntimeError(f"The model is {condition.replace('_', ' ')} ({solver})")
+            logger.warning("%s finished with status %s (%s)", solver, status, condition)
+            errors.append(f"{solver}: {status} ({condition})")
+            continue
+
+        logger.info("Solved with %s in %.2f s", solver, solve_time)
+        return {'name': solver, 'options': options, 'solve_time': solve_time, 'status': status, 'condition': condition, 'warm_start': warm_start}
+
+    raise RuntimeError("No solver could optimize the network - " + "; ".join(errors))
@@ -0,0 +1,59 @@
+import glob
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def solve_twice(queue):
+    # Builds, solves, updates and re-solves a small network's model, and reports the basis file it used
+    import logging
+    import warnings
+    import pandas as pd
+    import pypsa
+    from model_reuse import get_model, solve_model
+
+    logging.disable(logging.CRITICAL)
+    warnings.filterwarnings('ignore')
+    network = pypsa.Network()
+    network.set_snapshots(pd.date_range('2030-01-01', periods=4, freq='h'))
+    network.add('Bus', ['Bus A', 'Bus B'])
+    network.add('Line', 'Line 1', bus0='Bus A', bus1='Bus B', x=0.1, s_nom=100)
+    network.add('Generator', ['Plant 1', 'Plant 2'], bus=['Bus A', 'Bus B'], p_nom=[100, 50], marginal_cost=[10, 30])
+    network.add('Load', 'Load_2', bus='Bus B', p_set=80)
+
+    state = get_model(network)
+    solve_model(state, 'highs')
+    network.generators.loc['Plant 1', 'p_nom'] = 60
+    solve_model(get_model(network), 'highs')
+    queue.put(state['basis_fn'] if os.path.exists(state['basis_fn']) else None)
+
+
+class ModelReuseTest(unittest.TestCase):
+
+    def test_worker_leaves_no_basis_file(self):
+        # Job and sweep workers exit without calling forget_model
+        with tempfile.TemporaryDirectory() as directory:
+            context = multiprocessing.get_context('spawn')
+            queue = context.Queue()
+            environ = dict(os.environ)
+            os.environ.update(TMPDIR=directory, TEMP=directory, TMP=directory)  # The worker's temporary directory
+            try:
+                process = context.Process(target=solve_twice, args=(queue,))
+                process.start()
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+            process.join(timeout=300)
+            self.assertEqual(process.exitcode, 0)
+            basis_fn = queue.get(timeout=5)
+
+            self.assertIsNotNone(basis_fn)  # The worker did warm start from a basis file
+            self.assertEqual(glob.glob(os.path.join(directory, '*.bas')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
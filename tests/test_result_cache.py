@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+import unittest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Builds a small network and prints its fingerprint
+FINGERPRINT_SCRIPT = '''
+import logging
+import pandas as pd
+import pypsa
+from result_cache import fingerprint_network
+
+logging.disable(logging.CRITICAL)
+network = pypsa.Network()
+network.set_snapshots(pd.date_range('2030-01-01', periods=4, freq='h'))
+network.add('Bus', ['Bus A', 'Bus B'])
+network.add('Line', 'Line 1', bus0='Bus A', bus1='Bus B', x=0.1, s_nom=100)
+network.add('Generator', 'Plant 1', bus='Bus A', p_nom=100, marginal_cost=10)
+network.add('Load', 'Load_2', bus='Bus B', p_set=50)
+network.add('StorageUnit', 'Storage 1', bus='Bus B', p_nom=10)
+print(fingerprint_network(network, solver_name='highs'))
+'''
+
+
+def fingerprint_in_new_process(hash_seed):
+    env = dict(os.environ, PYTHONHASHSEED=str(hash_seed), PYTHONWARNINGS='ignore')
+    completed = subprocess.run([sys.executable, '-c', FINGERPRINT_SCRIPT], cwd=PACKAGE_DIR, env=env,
+                               capture_output=True, text=True, check=True)
+    return completed.stdout.strip().splitlines()[-1]
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_fingerprint_is_the_same_in_every_process(self):
+        # Job workers and restarted apps must find each other's cached results
+        self.assertEqual(fingerprint_in_new_process(1), fingerprint_in_new_process(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
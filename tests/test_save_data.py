@@ -0,0 +1,59 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from external_functions import load_data_table, save_data
+from setup_database import create_schema, epoch
+
+
+def browser_round_trip(df):
+    # The rows as the editor's DataTable sends them back: serialized by Dash (datetimes as ISO 8601 text)
+    return pd.DataFrame(json.loads(json.dumps(df.to_dict('records'), cls=PlotlyJSONEncoder)))
+
+
+class SaveDataRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.path = os.path.join(self.directory.name, 'power_system.db')
+        times = [epoch('2030-01-01 00:00:00') + 3600 * hour for hour in range(400)]
+        conn = sqlite3.connect(self.path)
+        create_schema(conn.cursor())
+        conn.executemany('INSERT INTO snapshots (snapshot_time, weight) VALUES (?, 1.0)', [(time,) for time in times])
+        conn.executemany('INSERT INTO wind_profile (profile_name, snapshot_time, profile) VALUES (?, ?, 0.5)', [('Wind A', time) for time in times])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_edited_timestamped_tables_keep_their_times(self):
+        for table_name, column, value_column in [('snapshots', 'snapshot_time', 'weight'), ('wind_profile', 'snapshot_time', 'profile')]:
+            before = load_data_table(self.path, table_name)
+            edited = browser_round_trip(before)
+            self.assertEqual(edited.loc[300, column], '2030-01-13T12:00:00')
+            edited.loc[300, value_column] = 0.25
+
+            changes = save_data(self.path, table_name, edited)
+
+            after = load_data_table(self.path, table_name)
+            self.assertEqual(changes, {'inserted': 0, 'updated': 1, 'deleted': 0})
+            pd.testing.assert_series_equal(after[column], before[column])
+            self.assertEqual(after.loc[300, value_column], 0.25)
+
+    def test_legacy_day_first_text_is_read_day_first(self):
+        edited = browser_round_trip(load_data_table(self.path, 'snapshots'))
+        edited.loc[300, 'snapshot_time'] = '13/01/2030 12:00'
+        self.assertEqual(save_data(self.path, 'snapshots', edited)['updated'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
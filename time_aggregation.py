@@ -0,0 +1,226 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from result_format import RESULT_SERIES
+
+logger = logging.getLogger(__name__)
+
+# Number of representative days to reduce the year to before optimizing (0 keeps every snapshot), and how days
+# are clustered: 'kmeans' (representative days are cluster means) or 'kmedoids' (they are real days)
+REPRESENTATIVE_DAYS = int(os.environ.get('CLEANPOWERSIM_REPRESENTATIVE_DAYS', 0))
+CLUSTER_METHOD = os.environ.get('CLEANPOWERSIM_CLUSTER_METHOD', 'kmeans')
+
+# Time resolution to optimize at, in hours (for example 2, 3 or 6); 1 keeps the hourly snapshots
+RESOLUTION_HOURS = int(os.environ.get('CLEANPOWERSIM_RESOLUTION_HOURS', 1))
+
+# Long-format time series tables: key column (the wide matrix's columns), timestamp column and value column
+TIME_SERIES_COLUMNS = {
+    'demand': ('bus_id', 'snapshot', 'demand_mw'),
+    'wind': ('profile_name', 'snapshot_time', 'profile'),
+    'solar': ('profile_name', 'snapshot_time', 'profile')
+}
+
+
+def kmeans(features, n_clusters, rng, iterations=100):
+    # Lloyd's algorithm with k-means++ starting centres; returns each row's cluster
+    centres = features[[rng.integers(len(features))]]
+    while len(centres) < n_clusters:
+        distances = ((features[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        probabilities = distances / distances.sum() if distances.sum() > 0 else None
+        centres = np.vstack([centres, features[rng.choice(len(features), p=probabilities)]])
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = ((features[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+        centres = np.array([features[labels == c].mean(axis=0) if (labels == c).any() else centres[c] for c in range(n_clusters)])
+    return labels
+
+def kmedoids(features, n_clusters, rng, iterations=100):
+    # Alternates between assigning rows to their nearest medoid and moving each medoid to the member with the
+    # least total distance to the rest of its cluster; returns each row's cluster
+    distances = np.sqrt(((features[:, None, :] - features[None, :, :]) ** 2).sum(axis=2))
+    medoids = [rng.integers(len(features))]
+    while len(medoids) < n_clusters:
+        nearest = distances[:, medoids].min(axis=1) ** 2
+        probabilities = nearest / nearest.sum() if nearest.sum() > 0 else None
+        medoids.append(rng.choice(len(features), p=probabilities))
+
+    medoids = np.array(medoids)
+    for _ in range(iterations):
+        labels = distances[:, medoids].argmin(axis=1)
+        new_medoids = medoids.copy()
+        for c in range(n_clusters):
+            members = np.flatnonzero(labels == c)
+            if len(members):
+                new_medoids[c] = members[distances[np.ix_(members, members)].sum(axis=1).argmin()]
+        if (new_medoids == medoids).all():
+            break
+        medoids = new_medoids
+    return distances[:, medoids].argmin(axis=1)
+
+def cluster_days(features, n_clusters, method='kmeans', seed=0):
+    # Clusters the rows of 'features' (one per day) and returns (labels, representative row of each cluster).
+    # The representative is the member closest to the cluster mean.
+    if method not in ('kmeans', 'kmedoids'):
+        raise ValueError(f"Unknown clustering method '{method}' (use 'kmeans' or 'kmedoids')")
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(features))
+    labels = (kmeans if method == 'kmeans' else kmedoids)(features, n_clusters, rng)
+
+    # Drop clusters that ended up empty and number the rest 0..n-1
+    labels = np.unique(labels, return_inverse=True)[1]
+    representatives = []
+    for c in range(labels.max() + 1):
+        members = np.flatnonzero(labels == c)
+        if method == 'kmeans':
+            centre = features[members].mean(axis=0)
+            representatives.append(members[((features[members] - centre) ** 2).sum(axis=1).argmin()])
+        else:
+            within = np.sqrt(((features[members, None, :] - features[None, members, :]) ** 2).sum(axis=2))
+            representatives.append(members[within.sum(axis=1).argmin()])
+    return labels, np.array(representatives)
+
+def aggregate_representative_days(demand_df, snapshots_df, wind_profile_df, solar_profile_df, n_days, method=CLUSTER_METHOD):
+    # Reduces the time series tables (as returned by load_data) to 'n_days' representative days by clustering
+    # the days on their demand, wind and solar profiles.  Each representative day's snapshot weight is its
+    # original weight times the number of days it stands for.  Days with fewer snapshots than the rest (such as a
+    # part day at the end) are kept as they are.
+    # Returns (demand_df, snapshots_df, wind_profile_df, solar_profile_df, calendar), where 'calendar' maps every
+    # original snapshot to the snapshot that represents it: {'snapshots': [...], 'representatives': [...]}.
+    snapshots_df = snapshots_df.assign(snapshot_time=pd.to_datetime(snapshots_df['snapshot_time'], dayfirst=True))
+    snapshots_df = snapshots_df.sort_values('snapshot_time').drop_duplicates(subset='snapshot_time').reset_index(drop=True)
+    snapshots = pd.DatetimeIndex(snapshots_df['snapshot_time'])
+
+    # One snapshots x key matrix per table
+    tables = {'demand': demand_df, 'wind': wind_profile_df, 'solar': solar_profile_df}
+    wide = {}
+    for name, df in tables.items():
+        key_column, time_column, value_column = TIME_SERIES_COLUMNS[name]
+        df = df.assign(**{time_column: pd.to_datetime(df[time_column], errors='coerce', dayfirst=True)}).dropna(subset=[time_column])
+        wide[name] = df.pivot_table(index=time_column, columns=key_column, values=value_column, aggfunc='last').reindex(snapshots)
+
+    # Only days with the usual number of snapshots are clustered
+    days = snapshots.normalize()
+    day_lengths = pd.Series(days).value_counts()
+    day_length = day_lengths.mode().max()
+    full_days = day_lengths.index[day_lengths == day_length].sort_values()
+    in_full_day = days.isin(full_days)
+
+    # Features: each day's profiles, scaled so every column runs up to 1 and every table counts equally
+    blocks = []
+    for matrix in wide.values():
+        if matrix.shape[1] == 0:
+            continue
+        values = matrix[in_full_day].fillna(0).to_numpy()
+        scale = np.abs(values).max(axis=0)
+        values = values / np.where(scale > 0, scale, 1) / np.sqrt(matrix.shape[1])
+        blocks.append(values.reshape(len(full_days), -1))
+    features = np.hstack(blocks) if blocks else np.zeros((len(full_days), 1))
+
+    labels, representatives = cluster_days(features, n_days, method)
+    cluster_sizes = np.bincount(labels)
+
+    # Positions of each full day's snapshots in 'snapshots' (one row per day)
+    day_positions = np.flatnonzero(in_full_day).reshape(len(full_days), day_length)
+
+    # Representative values: the cluster mean for k-means, the medoid day itself for k-medoids
+    weights = snapshots_df['weight'].fillna(1).to_numpy(dtype=float, copy=True) if 'weight' in snapshots_df else np.ones(len(snapshots))
+    representative_values = {name: [] for name in wide}
+    for c, day in enumerate(representatives):
+        members = day_positions[labels == c]
+        for name, matrix in wide.items():
+            values = matrix.to_numpy()[members].mean(axis=0) if method == 'kmeans' else matrix.to_numpy()[day_positions[day]]
+            representative_values[name].append(values)
+        weights[day_positions[day]] *= cluster_sizes[c]
+
+    # Snapshots kept: the representative days (in calendar order) and any part days
+    kept = np.sort(np.concatenate([day_positions[representatives].ravel(), np.flatnonzero(~in_full_day)]))
+    kept_snapshots = snapshots[kept]
+
+    reduced = {}
+    for name, matrix in wide.items():
+        key_column, time_column, value_column = TIME_SERIES_COLUMNS[name]
+        values = matrix.copy()
+        for c, day in enumerate(representatives):
+            values.iloc[day_positions[day]] = representative_values[name][c]
+        long_df = values.iloc[kept].rename_axis(index=time_column, columns=key_column).stack().dropna().rename(value_column).reset_index()
+        long_df.insert(0, 'id', np.arange(1, len(long_df) + 1))
+        reduced[name] = long_df[[column for column in tables[name].columns if column in long_df.columns]]
+
+    reduced_snapshots_df = snapshots_df.iloc[kept].assign(weight=weights[kept]).reset_index(drop=True)
+
+    # Each original snapshot maps to the snapshot at the same time of day on its representative day
+    representative_positions = np.arange(len(snapshots))
+    representative_positions[day_positions.ravel()] = day_positions[representatives[labels]].ravel()
+    calendar = {
+        'snapshots': [str(snapshot) for snapshot in snapshots],
+        'representatives': [str(snapshot) for snapshot in snapshots[representative_positions]]
+    }
+
+    logger.info("Aggregated %d days into %d representative days (%s), %d -> %d snapshots",
+                len(full_days), len(representatives), method, len(snapshots), len(kept_snapshots))
+    return reduced['demand'], reduced_snapshots_df, reduced['wind'], reduced['solar'], calendar
+
+def resample_time_series(demand_df, snapshots_df, wind_profile_df, solar_profile_df, hours):
+    # Resamples the time series tables (as returned by load_data) to one snapshot every 'hours' hours, averaging
+    # demand and the wind and solar profiles (and so the generators' p_max_pu) over each block.  A block's weight
+    # is the sum of its snapshots' weights, so energy totals and the objective stay comparable.
+    # Returns (demand_df, snapshots_df, wind_profile_df, solar_profile_df, calendar) like aggregate_representative_days.
+    frequency = f'{hours}h'
+    snapshots_df = snapshots_df.assign(snapshot_time=pd.to_datetime(snapshots_df['snapshot_time'], dayfirst=True))
+    snapshots_df = snapshots_df.sort_values('snapshot_time').drop_duplicates(subset='snapshot_time')
+    if 'weight' not in snapshots_df:
+        snapshots_df = snapshots_df.assign(weight=1.0)
+    blocks = snapshots_df['snapshot_time'].dt.floor(frequency)
+
+    resampled_snapshots_df = snapshots_df.assign(weight=snapshots_df['weight'].fillna(1), block=blocks.values).groupby('block', sort=True).agg(
+        id=('id', 'first'), weight=('weight', 'sum')).rename_axis('snapshot_time').reset_index()
+    resampled_snapshots_df = resampled_snapshots_df[[column for column in snapshots_df.columns if column in resampled_snapshots_df.columns]]
+
+    resampled = {}
+    for name, df in {'demand': demand_df, 'wind': wind_profile_df, 'solar': solar_profile_df}.items():
+        key_column, time_column, value_column = TIME_SERIES_COLUMNS[name]
+        times = pd.to_datetime(df[time_column], errors='coerce', dayfirst=True)
+        long_df = df.assign(**{time_column: times.dt.floor(frequency)}).dropna(subset=[time_column])
+        long_df = long_df.groupby([key_column, time_column], sort=True)[value_column].mean().reset_index()
+        long_df.insert(0, 'id', np.arange(1, len(long_df) + 1))
+        resampled[name] = long_df[[column for column in df.columns if column in long_df.columns]]
+
+    calendar = {
+        'snapshots': [str(snapshot) for snapshot in snapshots_df['snapshot_time']],
+        'representatives': [str(snapshot) for snapshot in blocks]
+    }
+
+    logger.info("Resampled %d snapshots to %d at %s-hourly resolution", len(snapshots_df), len(resampled_snapshots_df), hours)
+    return resampled['demand'], resampled_snapshots_df, resampled['wind'], resampled['solar'], calendar
+
+def combine_calendars(first, second):
+    # Chains two calendars: the original snapshots of 'first' mapped through both reductions
+    mapping = dict(zip(second['snapshots'], second['representatives']))
+    return {
+        'snapshots': first['snapshots'],
+        'representatives': [mapping[representative] for representative in first['representatives']]
+    }
+
+def expand_to_calendar(optimization_results, calendar):
+    # Spreads compact results (see result_format) solved on representative days back over the full calendar, so
+    # each day shows the results of the day that represents it
+    positions = {snapshot: i for i, snapshot in enumerate(optimization_results['snapshots'])}
+    rows = np.array([positions.get(representative, -1) for representative in calendar['representatives']], dtype=int)
+
+    def expand(entry):
+        values = entry['values'][np.maximum(rows, 0)]
+        values[rows < 0] = np.nan
+        return {**entry, 'values': values}
+
+    expanded = dict(optimization_results)
+    expanded['snapshots'] = calendar['snapshots']
+    for name in RESULT_SERIES:
+        expanded[name] = expand(optimization_results[name])
+    return expanded